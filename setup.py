@@ -10,8 +10,19 @@ setup(name="tsquare",
       author_email='sean.william.g@gmail.com',
       url='https://github.com/swgillespie/tsquare',
       py_modules=['tsquare',
+                  'tsquare.asyncapi',
+                  'tsquare.cache',
                   'tsquare.core',
-                  'tsquare.parsers'],
+                  'tsquare.decoders',
+                  'tsquare.httpcache',
+                  'tsquare.instrumentation',
+                  'tsquare.parsers',
+                  'tsquare.pool',
+                  'tsquare.scheduler',
+                  'tsquare.sessions',
+                  'tsquare.store',
+                  'tsquare.sync',
+                  'tsquare.transport'],
       long_description="Get and manipulate the state of TSquare with python!",
       install_requires=['requests>=1.2.3',
                         'BeautifulSoup>=3.2.1',
@@ -0,0 +1,95 @@
+from multiprocessing.pool import ThreadPool
+import threading
+
+from core import TSquareAPI
+
+DEFAULT_POOL_SIZE = 16
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_pool():
+    """
+    Returns the thread pool shared by every AsyncTSquareAPI that wasn't
+    given one explicitly, creating it on first use.
+    """
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = ThreadPool(DEFAULT_POOL_SIZE)
+        return _default_pool
+
+
+def _async_method(name):
+    def _method(self, *args, **kwargs):
+        callback = kwargs.pop('callback', None)
+        return self._pool.apply_async(_call_api,
+                                      (self._login, name, args, kwargs),
+                                      callback=callback)
+    _method.__name__ = name
+    _method.__doc__ = """
+        Non-blocking version of TSquareAPI.{}. Accepts the same arguments,
+        plus an optional callback keyword argument that is called with the
+        result once it is available.
+        @returns An AsyncResult whose get() returns the result, or raises the
+                 exception raised by the call.
+        """.format(name)
+    return _method
+
+
+def _call_api(login, name, args, kwargs):
+    # the login was queued before this call, so it is either running on
+    # another worker or finished already; waiting on it can't deadlock.
+    return getattr(login.get(), name)(*args, **kwargs)
+
+
+class AsyncTSquareAPI(object):
+    """
+    A non-blocking TSquareAPI. Every call, including the CAS login flow,
+    runs on a shared, bounded worker pool and immediately returns an
+    AsyncResult, so a server can multiplex many users over a fixed number
+    of threads instead of dedicating a thread to each request.
+    """
+
+    def __init__(self, username, password, pool=None, callback=None,
+                 **kwargs):
+        """
+        Initialize an AsyncTSquareAPI object and queue the login.
+        @param username - The username to log in with
+        @param password - The password to log in with. Not stored.
+        @param pool - The ThreadPool to run calls on. If None, a pool of
+                      DEFAULT_POOL_SIZE threads shared by every
+                      AsyncTSquareAPI is used.
+        @param callback - Called with the logged in TSquareAPI once the
+                          login succeeds.
+        Any other keyword arguments are passed on to TSquareAPI.
+        """
+        self.username = username
+        self._pool = pool if pool is not None else get_default_pool()
+        self._login = self._pool.apply_async(TSquareAPI, (username, password),
+                                             kwargs, callback=callback)
+
+    @property
+    def login_result(self):
+        """
+        The AsyncResult of the login. Its get() returns the underlying
+        TSquareAPI, or raises TSquareAuthException if the login failed.
+        """
+        return self._login
+
+    def ready(self):
+        """
+        Returns True once the login has finished, successfully or not.
+        """
+        return self._login.ready()
+
+    logout = _async_method('logout')
+    get_user_info = _async_method('get_user_info')
+    get_site_by_id = _async_method('get_site_by_id')
+    get_sites = _async_method('get_sites')
+    get_announcements = _async_method('get_announcements')
+    get_tools = _async_method('get_tools')
+    get_assignments = _async_method('get_assignments')
+    get_grades = _async_method('get_grades')
+    get_syllabus = _async_method('get_syllabus')
@@ -0,0 +1,81 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache(object):
+    """
+    A small, thread-safe LRU cache whose entries expire after a fixed
+    time-to-live. Used by TSquareAPI to avoid re-scraping pages that
+    rarely change, such as the list of tools attached to a site.
+    """
+
+    def __init__(self, ttl=300, max_size=128):
+        """
+        Initialize a TTLCache.
+        @param ttl - The number of seconds an entry stays valid. A ttl of
+                     None means entries never expire; a ttl of 0 disables
+                     the cache entirely.
+        @param max_size - The maximum number of entries to hold. When full,
+                          the least recently used entry is evicted.
+        """
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get(self, key, default=None):
+        """
+        Returns the value stored under key, or default if there is no
+        such entry or the entry has expired.
+        """
+        with self._lock:
+            try:
+                expires, value = self._entries.pop(key)
+            except KeyError:
+                return default
+            if expires is not None and expires <= time.time():
+                return default
+            # re-insert to mark this entry as the most recently used
+            self._entries[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        """
+        Stores value under key, evicting the least recently used entry
+        if the cache is full.
+        """
+        if self.ttl == 0 or self.max_size <= 0:
+            return
+        expires = None if self.ttl is None else time.time() + self.ttl
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """
+        Removes the entry stored under key, or every entry if key is None.
+        """
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __getstate__(self):
+        # locks can't be pickled, and pickled entries would be stale anyway
+        return {'ttl': self.ttl, 'max_size': self.max_size}
+
+    def __setstate__(self, state):
+        self.__init__(state['ttl'], state['max_size'])
+
+
+_MISSING = object()
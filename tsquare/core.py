@@ -1,9 +1,25 @@
+from copy import deepcopy
+import hashlib
+import itertools
+import json
+import logging
+import threading
+import time
 import requests
 import parsers
+from cache import TTLCache
+from decoders import get_decoder
+from instrumentation import timer, traced
+from transport import HTTPTransport
+
+_log = logging.getLogger(__name__)
+_log.addHandler(logging.NullHandler())
 
 BASE_URL_GATECH = 'https://login.gatech.edu/cas/'
 SERVICE = 'https://t-square.gatech.edu/sakai-login-tool/container'
 BASE_URL_TSQUARE = 'https://t-square.gatech.edu/direct/'
+# how many bytes at a time are read from a page when streaming is enabled
+STREAM_CHUNK_SIZE = 8192
 
 class TSquareException(Exception):
     def __init__(self, message):
@@ -28,46 +44,318 @@ class AssignmentParseException(TSquareException):
 
 
 class TSquareAPI(object):
+    _instrumentation = None
+    auto_reauth = False
+    credential_provider = None
+    _expired = False
+    _login_generation = 0
+    _decode = staticmethod(json.loads)
+    _password = None
+    _parser = None
+    _scraper_name = 'bs4'
+    _parse_pool = None
+    _store = None
+
     def requires_authentication(func):
         """
         Function decorator that throws an exception if the user
         is not authenticated, and executes the function normally
-        if the user is authenticated.
+        if the user is authenticated. A lazy object logs in first. With
+        auto_reauth, an expired session is renewed and the function is
+        retried once.
         """
         def _auth(self, *args, **kwargs):
+            # read first, so that a login finishing after the check below
+            # isn't mistaken for the one that expired
+            generation = self._login_generation
             if not self._authenticated:
-                raise NotAuthenticatedException('Function {} requires'
-                                                .format(func.__name__)
-                                                + ' authentication')
-            else:
+                self._authenticate(func.__name__, generation)
+            generation = self._login_generation
+            try:
                 return func(self, *args, **kwargs)
-        return _auth
+            except SessionExpiredException:
+                if not self.auto_reauth:
+                    raise
+            self._reauthenticate(generation)
+            return func(self, *args, **kwargs)
+        _auth.__name__ = func.__name__
+        _auth.__doc__ = func.__doc__
+        return traced(_auth)
 
     def __init__(self, username, password,
-                 scraper='bs4'):
+                 scraper='bs4', tool_cache_ttl=300, tool_cache_size=128,
+                 max_workers=4, transport=None, pool_connections=10,
+                 pool_maxsize=None, http_cache=None, stream=False,
+                 instrumentation=None, auto_reauth=False,
+                 credential_provider=None, json_decoder=None,
+                 page_cache_size=128, scheduler=None, lazy=False,
+                 parse_pool=None, store=None):
         """
         Initialize a TSquareAPI object.
         Logs in to TSquare with username and password.
         @param username - The username to log in with
-        @param password - The password to log in with. Not stored.
+        @param password - The password to log in with. Not stored. If None,
+                          the object is created logged out; see login and
+                          sessions.load_session.
+        @param tool_cache_ttl - How many seconds the tools scraped from a
+                                site's portal page are reused before the
+                                page is fetched again. 0 disables caching.
+        @param tool_cache_size - The maximum number of sites whose tools
+                                 (and the urls of their iframes) are cached
+                                 at once.
+        @param max_workers - The default number of threads that the get_all_*
+                             methods use to fetch sites concurrently.
+        @param transport (HTTPTransport) - The connection pools to send
+                                           requests through. Pass the same
+                                           transport to several TSquareAPI
+                                           objects to share keep-alive
+                                           connections between them. If
+                                           None, a new one is created.
+        @param pool_connections - The number of hosts to pool connections
+                                  for when creating a transport.
+        @param pool_maxsize - The number of connections kept alive per host
+                              when creating a transport. Defaults to enough
+                              connections for max_workers threads.
+        @param http_cache (HTTPCache) - If given, the JSON responses of
+                                        get_user_info, get_site_by_id,
+                                        get_sites and get_announcements are
+                                        revalidated with conditional requests
+                                        instead of being downloaded again.
+        @param stream - If True, portal and tool pages are fed to the
+                        scraper as they download, and the download stops
+                        as soon as the tools or the wanted iframe are found.
+                        Only the 'default' scraper parses incrementally.
+        @param instrumentation (Instrumentation) - Receives the time spent
+                                                   in each phase of every
+                                                   call, e.g. a
+                                                   MetricsAggregator.
+        @param auto_reauth - If True, a call that finds the session expired
+                             gets a new service ticket with the stored
+                             ticket-granting ticket (or logs in again with
+                             credential_provider if that fails) and is then
+                             retried. Threads that find the session expired
+                             at the same time share a single login.
+        @param credential_provider - A function taking the username and
+                                     returning the password, used by
+                                     auto_reauth when the ticket-granting
+                                     ticket has expired too.
+        @param json_decoder - The name of the JSON decoder to use for the
+                              /direct/ endpoints ('json', 'simplejson',
+                              'ujson' or 'auto' for the fastest installed),
+                              or a function taking the body of a response.
+                              Defaults to the standard library.
+        @param page_cache_size - The maximum number of assignment, gradebook
+                                 and syllabus pages whose fingerprint and
+                                 scraped result are remembered. A page
+                                 that comes back unchanged isn't scraped
+                                 again; see changed_since. 0 disables this.
+        @param scheduler (RequestScheduler) - If given, every request,
+                                              including the CAS login, is
+                                              rate limited and retried
+                                              through it. Share one between
+                                              objects to pace them together.
+        @param lazy - If True, the object is built without contacting CAS,
+                      and logs in on the first call that needs it (or on
+                      warm). Threads making that first call at the same
+                      time share a single login. The password is kept in
+                      memory until then.
+        @param parse_pool (multiprocessing.Pool) - If given, the assignment,
+                                                   gradebook and syllabus
+                                                   pages are scraped in this
+                                                   pool's processes, so that
+                                                   threads scraping pages at
+                                                   the same time don't wait
+                                                   on each other for the
+                                                   GIL. Share one pool
+                                                   between objects. It isn't
+                                                   pickled with the object.
+        @param store (store.DataStore) - If given, the user, sites,
+                                         announcements, assignments and
+                                         grades fetched by get_user_info,
+                                         get_sites, get_announcements,
+                                         get_assignments and get_grades are
+                                         written to it, so that they can be
+                                         read without TSquare later; see
+                                         store.StoreReader. Items without
+                                         an id aren't stored, and a failed
+                                         write doesn't fail the call; it is
+                                         reported to instrumentation as a
+                                         'store' phase with an 'error'.
 
         @returns A TSquareUser object that represents the user that
                  was logged in.
         @throws TSquareAuthException - If something goes wrong during the
         authentication process (i.e. credentials are bad)
         """
-        self._authenticated = True
+        self._authenticated = False
         self.username = username
-        self._tg_ticket, self._service_ticket = _get_ticket(username, password)
-        self._session = _tsquare_login(self._service_ticket)
-        try:
-            self._html_iface = parsers.REGISTERED_METHODS[scraper]()
-        except KeyError:
-            self._html_iface = parsers.REGISTERED_METHODS['default']()
-        
+        if transport is None:
+            transport = HTTPTransport(pool_connections,
+                                      pool_maxsize or max(10, max_workers))
+        self._transport = transport
+        # one session for the whole CAS flow, so the connection to each host
+        # is opened once and kept alive for every step of the login
+        self._session = transport.session()
+        if scheduler is not None:
+            self._session = scheduler.wrap(self._session)
+        self._scraper_name = scraper
+        self._parse_pool = parse_pool
+        self._store = store
+        self._tool_cache = TTLCache(tool_cache_ttl, tool_cache_size)
+        # iframe urls don't change during a term, so they're kept until
+        # they stop working
+        self._frame_cache = TTLCache(None, tool_cache_size)
+        self._page_cache = TTLCache(None, page_cache_size)
+        self.max_workers = max_workers
+        self._http_cache = http_cache
+        self.stream = stream
+        self._instrumentation = instrumentation
+        self.auto_reauth = auto_reauth
+        self.credential_provider = credential_provider
+        self._decode = get_decoder(json_decoder)
+        self._login_lock = threading.RLock()
+        if lazy:
+            self._password = password
+        elif password is not None:
+            self.login(password)
 
-    @requires_authentication
+    @property
+    def _html_iface(self):
+        # built on first use, so that creating an object stays cheap
+        if self._parser is None:
+            try:
+                parser_class = parsers.REGISTERED_METHODS[self._scraper_name]
+            except KeyError:
+                self._scraper_name = 'default'
+                parser_class = parsers.REGISTERED_METHODS['default']
+            self._parser = parser_class()
+        return self._parser
+
+    def _authenticate(self, name, generation):
+        # another thread may be logging in right now, so what to do is only
+        # decided once it is done
+        with self._login_lock:
+            if self._authenticated:
+                return
+            if self._password is not None:
+                self.warm()
+            elif self.auto_reauth and self._expired:
+                self._reauthenticate(generation)
+            else:
+                raise NotAuthenticatedException('Function {} requires'
+                                                .format(name)
+                                                + ' authentication')
+
+    def warm(self):
+        """
+        Does the work a lazy object puts off: logs in, if it hasn't yet, and
+        builds the scraper. Meant to be called from a background thread
+        before the object is needed; if another thread is already logging
+        in, waits for it instead of logging in again.
+        @returns This object
+        @throws TSquareAuthException - If the credentials are bad. They are
+                                       then forgotten, so later calls raise
+                                       NotAuthenticatedException.
+        """
+        with self._login_lock:
+            password = self._password
+            if password is not None and not self._authenticated:
+                try:
+                    self.login(password)
+                except TSquareAuthException:
+                    self._password = None
+                    raise
+        self._html_iface
+        return self
+
+    @traced
+    def login(self, password):
+        """
+        Runs the CAS login flow for this object's username and redeems the
+        resulting service ticket with TSquare.
+        @param password - The password to log in with. Not stored.
+        @throws TSquareAuthException - If the credentials are bad
+        """
+        with timer(self._instrumentation, 'login', step='ticket'):
+            self._tg_ticket, self._service_ticket = _get_ticket(self.username,
+                                                                password,
+                                                                self._session)
+        with timer(self._instrumentation, 'login', step='redeem'):
+            _tsquare_login(self._service_ticket, self._session)
+        self._logged_in()
+
+    def _logged_in(self):
+        self._password = None
+        self._authenticated = True
+        self._expired = False
+        self._login_generation += 1
+
+    def _session_expired(self, generation=None):
+        # It's up to the user to re-authenticate, unless auto_reauth is on.
+        # A response to a request sent before the latest login says nothing
+        # about the new session, so it doesn't log the object out.
+        with self._login_lock:
+            if generation is None or generation == self._login_generation:
+                self._authenticated = False
+                self._expired = True
+        raise SessionExpiredException('The session has expired')
+
+    @traced
+    def _reauthenticate(self, generation):
+        """
+        Renews an expired session. Only one thread logs in; threads that
+        were waiting for it return as soon as it is done.
+        @param generation - The login generation the caller saw expire. If
+                            a login has happened since, there's nothing to do.
+        @throws SessionExpiredException - If the session can't be renewed
+        """
+        with self._login_lock:
+            if self._login_generation != generation and self._authenticated:
+                return
+            try:
+                with timer(self._instrumentation, 'login', step='service'):
+                    self._service_ticket = _get_service_ticket(self._tg_ticket,
+                                                               self._session)
+                with timer(self._instrumentation, 'login', step='redeem'):
+                    _tsquare_login(self._service_ticket, self._session)
+                self._logged_in()
+                return
+            except TSquareAuthException:
+                # the ticket-granting ticket has expired too
+                if self.credential_provider is None:
+                    raise SessionExpiredException('The session has expired '
+                                                  'and no credential provider '
+                                                  'was given')
+            self.login(self.credential_provider(self.username))
+            self.invalidate_tools()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_login_lock', None)
+        # never write a password out; a lazy object that hasn't logged in
+        # yet comes back logged out
+        state.pop('_password', None)
+        # neither can a process pool
+        state.pop('_parse_pool', None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._login_lock = threading.RLock()
+
+    @traced
     def logout(self):
+        """
+        Destroys this object's ticket-granting ticket. A lazy object that
+        hasn't logged in yet just forgets its password, without contacting
+        CAS.
+        """
+        with self._login_lock:
+            if not self._authenticated and self._password is not None:
+                self._password = None
+                return
+        if not self._authenticated:
+            self._authenticate('logout', self._login_generation)
         self._session.delete(BASE_URL_GATECH + 'rest/tickets/{}'.format(self._tg_ticket))
         self._authenticated = False
         
@@ -77,11 +365,10 @@ class TSquareAPI(object):
         Returns a TSquareUser object representing the currently logged in user.
         Throws a NotAuthenticatedException if the user is not authenticated.
         """
-        response = self._session.get(BASE_URL_TSQUARE + '/user/current.json')
-        response.raise_for_status() # raises an exception if not 200: OK
-        user_data = response.json()
+        user_data = self._get_json(BASE_URL_TSQUARE + '/user/current.json')
         del user_data['password'] # tsquare doesn't store passwords
-        return TSquareUser(**user_data)
+        self._write_through('user', '', [(user_data.get('id'), user_data)])
+        return TSquareUser.from_dict(user_data)
 
     @requires_authentication
     def get_site_by_id(self, id):
@@ -91,10 +378,11 @@ class TSquareAPI(object):
         @param id - The entityID of the site to look up
         @returns A TSquareSite object
         """
-        response = self._session.get(BASE_URL_TSQUARE + '/site/{}.json'.format(id))
-        response.raise_for_status()
-        site_data = response.json()
-        return TSquareSite(**site_data)
+        site_data = self._get_json(BASE_URL_TSQUARE + '/site/{}.json'.format(id))
+        # one site doesn't make the stored list of sites fresh
+        self._write_through('site', '', [(site_data.get('id'), site_data)],
+                            replace=False, fetched=False)
+        return TSquareSite.from_dict(site_data)
         
     @requires_authentication
     def get_sites(self, filter_func=lambda x: True):
@@ -111,29 +399,60 @@ class TSquareAPI(object):
         @returns - A list of TSquareSite objects encapsulating t-square's JSON
                    response.
         """
-        response = self._session.get(BASE_URL_TSQUARE + 'site.json')
-        response.raise_for_status() # raise an exception if not 200: OK
-        site_list = response.json()['site_collection']
+        generation = self._login_generation
+        site_list = self._get_json(BASE_URL_TSQUARE + 'site.json')['site_collection']
         if not site_list:
-            # this means that this t-square session expired. It's up
-            # to the user to re-authenticate.
-            self._authenticated = False
-            raise SessionExpiredException('The session has expired')
+            # this means that this t-square session expired.
+            self._session_expired(generation)
+        with timer(self._instrumentation, 'build', count=len(site_list)):
+            sites = self._build_sites(site_list, filter_func)
+        # every site is stored, filtered or not
+        self._write_through('site', '', [(x.get('id'), x) for x in site_list])
+        return sites
+
+    def _build_sites(self, site_list, filter_func):
         result_list = []
         for site in site_list:
-            t_site = TSquareSite(**site)
-            if not hasattr(t_site, "props"):
-                t_site.props = {}
-            if not 'banner-crn' in t_site.props:
-                t_site.props['banner-crn'] = None
-            if not 'term' in t_site.props:
-                t_site.props['term'] = None
-            if not 'term_eid' in t_site.props:
-                t_site.props['term_eid'] = None
+            t_site = _build_site(site)
             if filter_func(t_site):
                 result_list.append(t_site)
         return result_list
-            
+
+    @requires_authentication
+    def iter_sites(self, filter_func=lambda x: True, raw_filter=None,
+                   page_size=None):
+        """
+        Like get_sites, but returns a generator that builds each TSquareSite
+        only when it is reached, so that the sites of a user never all
+        exist at once. The first page is fetched before this returns, so
+        that an expired session is reported here; later pages are fetched
+        as the generator reaches them.
+        @param filter_func - As in get_sites.
+        @param raw_filter - A function taking the decoded JSON dictionary of
+                            a site. Sites for which it returns False are
+                            skipped without building a TSquareSite.
+        @param page_size - If not None, sites are requested this many at a
+                           time instead of all at once.
+        """
+        generation = self._login_generation
+        pages = self._iter_pages(BASE_URL_TSQUARE + 'site.json',
+                                 'site_collection', page_size)
+        first = next(pages)
+        if not first:
+            # this means that this t-square session expired.
+            self._session_expired(generation)
+        return self._iter_sites(itertools.chain([first], pages), filter_func,
+                                raw_filter)
+
+    def _iter_sites(self, pages, filter_func, raw_filter):
+        for page in pages:
+            for site in page:
+                if raw_filter is None or raw_filter(site):
+                    t_site = _build_site(site)
+                    if filter_func(t_site):
+                        yield t_site
+
+
     @requires_authentication
     def get_announcements(self, site=None, num=10, age=20):
         """
@@ -151,30 +470,168 @@ class TSquareAPI(object):
                    at most num, and it may be less than num depending on
                    the number of announcements whose age is less than age.
         """
-        url = BASE_URL_TSQUARE + 'announcement/'
-        if site:
-            url += 'site/{}.json?n={}&d={}'.format(site.id, num, age)
+        url = _announcement_url(site, num, age)
+        announcement_list = self._get_json(url)['announcement_collection']
+        if self._store is not None:
+            self._write_announcements(site, announcement_list)
+        with timer(self._instrumentation, 'build', count=len(announcement_list)):
+            return [TSquareAnnouncement.from_dict(x) for x in announcement_list]
+
+    def _write_announcements(self, site, announcement_list):
+        # only the newest announcements are fetched, so older stored ones
+        # are kept rather than replaced. Only the fetch that was made is
+        # marked fresh: the newest announcements of every site may leave
+        # out ones of a single site that its own fetch would return.
+        by_site = {}
+        for x in announcement_list:
+            by_site.setdefault(x.get('siteId', ''), []).append((x.get('id'), x))
+        for site_id, items in by_site.items():
+            self._write_through('announcement', site_id, items, replace=False,
+                                fetched=False)
+        self._write_through('announcement', site.id if site else '', [],
+                            replace=False)
+
+    @requires_authentication
+    def iter_announcements(self, site=None, num=10, age=20, page_size=None,
+                           raw_filter=None):
+        """
+        Like get_announcements, but returns a generator that builds each
+        TSquareAnnouncement only when it is reached. The first page is
+        fetched before this returns; later pages as the generator reaches
+        them.
+        @param page_size - If not None, announcements are requested this
+                           many at a time, so that long histories can be
+                           walked without holding all of them.
+        @param raw_filter - A function taking the decoded JSON dictionary of
+                            an announcement. Announcements for which it
+                            returns False are skipped without building a
+                            TSquareAnnouncement.
+        """
+        pages = self._iter_pages(_announcement_url(site, num, age),
+                                 'announcement_collection', page_size, num)
+        return self._iter_models(itertools.chain([next(pages)], pages),
+                                 TSquareAnnouncement, raw_filter)
+
+    def _iter_models(self, pages, model, raw_filter):
+        for page in pages:
+            for data in page:
+                if raw_filter is None or raw_filter(data):
+                    yield model.from_dict(data)
+
+    def _iter_pages(self, url, key, page_size, limit=None):
+        """
+        Generates the pages of a /direct/ JSON collection as lists of
+        dictionaries, using the _start and _limit parameters of the entity
+        broker. If page_size is None, the whole collection is one page.
+        """
+        if page_size is None:
+            yield self._get_json(url)[key]
+            return
+        separator = '&' if '?' in url else '?'
+        start = 0
+        while True:
+            size = page_size if limit is None else min(page_size, limit - start)
+            page = self._get_json('{}{}_start={}&_limit={}'
+                                  .format(url, separator, start, size))[key]
+            yield page
+            start += len(page)
+            if len(page) < size or (limit is not None and start >= limit):
+                return
+
+    def _get_json(self, url):
+        """
+        GETs one of the /direct/ JSON endpoints and returns the decoded
+        body, going through the HTTP cache if there is one. Either way, the
+        body is decoded straight from the bytes received, without building
+        a unicode copy of it first.
+        @throws requests.HTTPError - If the response isn't 200: OK
+        """
+        if self._http_cache is not None:
+            generation = self._login_generation
+            check = lambda response: self._check_session(response, generation)
+            with timer(self._instrumentation, 'http', url=url) as t:
+                content = self._http_cache.get(self._session, url,
+                                               key=self.username + ' ' + url,
+                                               check=check)
+                t.info['bytes'] = len(content)
         else:
-            url += 'user.json?n={}&d={}'.format(num, age)
-        request = self._session.get(url)
-        request.raise_for_status()
-        announcement_list = request.json()['announcement_collection']
-        return map(lambda x: TSquareAnnouncement(**x), announcement_list)
+            content = self._get(url).content
+        with timer(self._instrumentation, 'parse', scraper='json'):
+            return self._decode(content)
+
+    def _get(self, url, **kwargs):
+        """
+        GETs url with this object's session.
+        @throws requests.HTTPError - If the response isn't 200: OK
+        """
+        generation = self._login_generation
+        with timer(self._instrumentation, 'http', url=url) as t:
+            response = self._session.get(url, **kwargs)
+            self._check_session(response, generation)
+            response.raise_for_status() # raise an exception if not 200: OK
+            t.info['bytes'] = len(response.content)
+        return response
+
+    def _check_session(self, response, generation=None):
+        """
+        Raises SessionExpiredException if response shows that TSquare no
+        longer recognizes the session, i.e. it was redirected to the login
+        page. Other errors, such as a 403 for a site the user can't see,
+        say nothing about the session and are left to raise_for_status.
+        @param generation - The login generation the request was sent in
+        """
+        if '/xlogin' in response.url or response.url.startswith(BASE_URL_GATECH):
+            self._session_expired(generation)
+
+    def _scrape(self, method, html, offload=False):
+        """
+        Scrapes html with the given method of the scraper.
+        @param offload - If True and this object has a parse_pool, the
+                         page is scraped in one of the pool's processes.
+        """
+        with timer(self._instrumentation, 'parse',
+                   scraper=type(self._html_iface).__name__):
+            if offload and self._parse_pool is not None:
+                return self._parse_pool.apply(parsers.scrape,
+                                              (self._scraper_name, method,
+                                               html))
+            return getattr(self._html_iface, method)(html)
 
     @requires_authentication
     def get_tools(self, site):
         """
-        Gets all tools associated with a site.
+        Gets all tools associated with a site. Results are cached per
+        site for tool_cache_ttl seconds; see invalidate_tools.
         @param site (TSquareSite) - The site to search for tools
-        @returns A list of dictionaries representing Tsquare tools.
+        @returns A list of TSquareTool objects.
         """
+        cached_tools = self._tool_cache.get(site.id)
+        if cached_tools is not None:
+            return list(cached_tools)
         # hack - gotta bypass the tsquare REST api because it kinda sucks with tools
         url = site.entityURL.replace('direct', 'portal')
-        response = self._session.get(url)
-        response.raise_for_status()
         # scrape the resulting html
-        tools_dict_list = self._html_iface.get_tools(response.text)
-        return [TSquareTool(**x) for x in tools_dict_list]
+        if self.stream:
+            tools_dict_list = self._stream_page(url, self._html_iface.stream_tools)
+        else:
+            tools_dict_list = self._scrape('get_tools', self._get(url).text)
+        with timer(self._instrumentation, 'build', count=len(tools_dict_list)):
+            tools = [TSquareTool.from_dict(x) for x in tools_dict_list]
+        self._tool_cache.set(site.id, tools)
+        return list(tools)
+
+    def invalidate_tools(self, site=None):
+        """
+        Discards cached tools and iframe urls so that the next call to
+        get_tools fetches the portal page again, and the next call to
+        get_assignments, get_grades or get_syllabus fetches the tool page
+        again.
+        @param site (TSquareSite) - The site whose tools should be discarded.
+                                    If None, tools for every site are
+                                    discarded.
+        """
+        self._tool_cache.invalidate(site.id if site is not None else None)
+        self._frame_cache.invalidate(site.id if site is not None else None)
 
     @requires_authentication
     def get_assignments(self, site):
@@ -186,24 +643,18 @@ class TSquareAPI(object):
         @returns - A list of TSquareSite objects. May be an empty list if
                    the site has defined no assignments.
         """
-        tools = self.get_tools(site)
-        assignment_tool_filter = [x.href for x in tools if x.name == 'assignment-grades']
-        if not assignment_tool_filter:
+        html = self._get_tool_frame(site, ('assignment-grades', 'assignments'),
+                                    'Assignments')
+        if html is None:
             return []
-        assignment_tool_url = assignment_tool_filter[0].href
-        response = self._session.get(assignment_tool_url)
-        response.raise_for_status()
-        iframes = self._html_iface.get_iframes(response.text)
-        iframe_url = ''
-        for frame in iframes:
-            if frame['title'] == 'Assignments ':
-                iframe_url = frame['src']
-        if iframe_url == '':
-            print "WARNING: NO ASSIGNMENT IFRAMES FOUND"
-        response = self._session.get(iframe_url)
-        response.raise_for_status()
-        assignment_dict_list = self._html_iface.get_assignments(response.text)
-        return [TSquareAssignment(**x) for x in assignment_dict_list]
+        assignment_dict_list = self._scrape_page(site, 'assignments',
+                                                 'get_assignments', html)
+        self._write_through('assignment', site.id,
+                            [(x.get('href') or x.get('title'), x)
+                             for x in assignment_dict_list])
+        with timer(self._instrumentation, 'build',
+                   count=len(assignment_dict_list)):
+            return [TSquareAssignment.from_dict(x) for x in assignment_dict_list]
 
     @requires_authentication
     def get_grades(self, site):
@@ -212,23 +663,29 @@ class TSquareAPI(object):
         whose keys are assignment categories, similar to how the page is laid out
         in TSquare.
         """
-        tools = self.get_tools(site)
-        grade_tool_filter = [x.href for x in tools if x.name == 'gradebook-tool']
-        if not grade_tool_filter:
+        html = self._get_tool_frame(site, ('gradebook-tool', 'grades'),
+                                    'Gradebook')
+        if html is None:
             return []
-        response = self._session.get(grade_tool_filter[0])
-        response.raise_for_status()
-        iframes = self._html_iface.get_iframes(response.text)
-        iframe_url = ''
-        for frame in iframes:
-            if frame['title'] == 'Gradebook ':
-                iframe_url = frame['src']
-        if iframe_url == '':
-            print "WARNING: NO GRADEBOOK IFRAMES FOUND"
-        response = self._session.get(iframe_url)
-        response.raise_for_status()
-        grade_dict_list = self._html_iface.get_grades(response.text)
-        return grade_dict_list
+        grade_dict_list = self._scrape_page(site, 'grades', 'get_grades', html)
+        self._write_through('grades', site.id, [('gradebook', grade_dict_list)])
+        # the caller may modify the result, which is also cached
+        return deepcopy(grade_dict_list)
+
+    @requires_authentication
+    def get_grade_records(self, site):
+        """
+        Gets the grades of a site as typed records, scraped in a single
+        pass over the gradebook: a parsers.Gradebook whose course_grade
+        is a parsers.CourseGrade (or None if it isn't available yet) and
+        whose records are parsers.GradeRecords, with scores as floats and
+        dates as datetime.dates. Returns None if the site has no gradebook.
+        """
+        html = self._get_tool_frame(site, ('gradebook-tool', 'grades'),
+                                    'Gradebook')
+        if html is None:
+            return None
+        return self._scrape_page(site, 'grades', 'get_grade_records', html)
 
     @requires_authentication
     def get_syllabus(self, site):
@@ -238,87 +695,352 @@ class TSquareAPI(object):
         whether or not pages are allowed to have HTML, so it is impossible
         to tell.
         """
-        tools = self.get_tools(site)
-        syllabus_filter = [x.href for x in tools if x.name == 'syllabus']
-        if not syllabus_filter:
+        html = self._get_tool_frame(site, ('syllabus',), 'Syllabus')
+        if html is None:
             return ''
-        response = self._session.get(syllabus_filter[0])
-        response.raise_for_status()
-        iframes = self._html_iface.get_iframes(response.text)
+        syllabus_html = self._scrape_page(site, 'syllabus', 'get_syllabus', html)
+        return syllabus_html
+
+    def _scrape_page(self, site, tool, method, html):
+        """
+        Scrapes the html of a tool's page with method, unless the page is
+        the same as the last time it was fetched and was already scraped
+        with method, in which case the result of that scrape is returned
+        instead. Every method scraping the same page shares one entry.
+        """
+        digest = hashlib.sha1(html.encode('utf-8')).hexdigest()
+        key = (site.id, tool)
+        entry = self._page_cache.get(key)
+        if entry is not None and entry[0] == digest:
+            if method in entry[1]:
+                return entry[1][method]
+            results, changed = dict(entry[1]), entry[2]
+        else:
+            results, changed = {}, time.time()
+        results[method] = self._scrape(method, html, offload=True)
+        self._page_cache.set(key, (digest, results, changed))
+        return results[method]
+
+    def _write_through(self, kind, site_id, items, replace=True, fetched=True):
+        if self._store is None:
+            return
+        # items without an id can't be stored
+        items = [x for x in items if x[0] is not None]
+        with timer(self._instrumentation, 'store', kind=kind) as t:
+            try:
+                self._store.put(self.username, kind, site_id, items, replace,
+                                fetched)
+            except Exception as e:
+                # the fetch itself succeeded; a failing store only costs the
+                # offline copy, so it's logged rather than raised
+                _log.warning('could not store %s of site %r for %s',
+                             kind, site_id, self.username, exc_info=True)
+                if self._instrumentation is not None:
+                    t.info['error'] = repr(e)
+
+    def changed_since(self, site, tool, since):
+        """
+        Tells whether a tool's page was different the last time it was
+        fetched than the time before, at any point after since. Lets a poller
+        skip work when get_assignments, get_grades (or get_grade_records)
+        or get_syllabus returned the same thing as before.
+        @param site (TSquareSite) - The site the tool belongs to
+        @param tool - 'assignments', 'grades' (which covers both get_grades
+                      and get_grade_records) or 'syllabus'
+        @param since - A time as returned by time.time()
+        @returns True if the page changed after since, or if it was never
+                 fetched (or has been forgotten), False otherwise.
+        """
+        entry = self._page_cache.get((site.id, tool))
+        return entry is None or entry[2] > since
+
+    def _get_tool_frame(self, site, tool_names, iframe_title):
+        """
+        Fetches the page that a site's tool shows in its main iframe.
+        @param site (TSquareSite) - The site the tool belongs to
+        @param tool_names - The names the tool may have; the scrapers
+                            don't agree on tool names.
+        @param iframe_title - The title of the tool's main iframe
+        @returns The html of the iframe's page, or None if the site doesn't
+                 have the tool.
+        """
+        html = self._get_cached_frame(site, iframe_title)
+        if html is not None:
+            return html
+        tools = self.get_tools(site)
+        tool_filter = [x.href for x in tools if x.name in tool_names]
+        if not tool_filter:
+            return None
+        if self.stream:
+            iframes = self._stream_page(tool_filter[0],
+                                        self._html_iface.stream_iframes,
+                                        iframe_title)
+        else:
+            iframes = self._scrape('get_iframes', self._get(tool_filter[0]).text)
         iframe_url = ''
         for frame in iframes:
-            if frame['title'] == 'Syllabus ':
+            if frame['title'].strip() == iframe_title:
                 iframe_url = frame['src']
         if iframe_url == '':
-            print "WARHING: NO SYLLABUS IFRAME FOUND"
-        response = self._session.get(iframe_url)
-        response.raise_for_status()
-        syllabus_html = self._html_iface.get_syllabus(response.text)
-        return syllabus_html
+            print "WARNING: NO {} IFRAME FOUND".format(iframe_title.upper())
+        response = self._get(iframe_url)
+        if iframe_url:
+            # remember where any redirects led, so they aren't followed again
+            frames = dict(self._frame_cache.get(site.id) or {})
+            frames[iframe_title] = response.url
+            self._frame_cache.set(site.id, frames)
+        return response.text
 
+    def _get_cached_frame(self, site, iframe_title):
+        """
+        Fetches the iframe titled iframe_title from the url it had the last
+        time, skipping the tool page.
+        @returns The html of the iframe's page, or None if its url isn't
+                 known or no longer works (the iframe answers with a 404 or
+                 a redirect).
+        """
+        iframe_url = (self._frame_cache.get(site.id) or {}).get(iframe_title)
+        if iframe_url is None:
+            return None
+        try:
+            response = self._get(iframe_url, allow_redirects=False)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            response = None
+        if response is None or 300 <= response.status_code < 400:
+            self._frame_cache.invalidate(site.id)
+            return None
+        return response.text
 
-class TSquareUser:
-    def __init__(self, **kwargs):
+    def _stream_page(self, url, scrape, *args):
         """
-        Encapsulates the raw JSON dictionary that represents a user in TSquare.
-        Converts a dictionary to attributes of an object for ease of use.
-        This constructor should never be called directly; instead, it is
-        called by get_user_info.
+        GETs url without reading the body up front and hands scrape an
+        iterator over the decoded body, so that it can stop the download
+        early.
         """
-        for key in kwargs:
-            setattr(self, key, kwargs[key])
+        with timer(self._instrumentation, 'stream', url=url,
+                   scraper=type(self._html_iface).__name__):
+            generation = self._login_generation
+            response = self._session.get(url, stream=True)
+            try:
+                self._check_session(response, generation)
+                response.raise_for_status()
+                if response.encoding is None:
+                    # can't sniff the charset without the whole body
+                    response.encoding = 'utf-8'
+                return scrape(response.iter_content(STREAM_CHUNK_SIZE,
+                                                    decode_unicode=True), *args)
+            finally:
+                _release(response)
 
-        def list_attrs(self):
-            return self.__dict__.keys()
+    @requires_authentication
+    def get_all_assignments(self, sites=None, max_workers=None):
+        """
+        Gets the assignments of several sites concurrently.
+        @param sites - A list of TSquareSite objects. If None, every site
+                       returned by get_sites is used.
+        @param max_workers - The number of sites fetched at once. Defaults to
+                             the max_workers given to the constructor.
+        @returns - A dictionary mapping each site's id to the list returned by
+                   get_assignments, or to the exception that was raised
+                   while fetching that site.
+        """
+        return self._fetch_all(self.get_assignments, sites, max_workers)
 
-class TSquareSite:
-    def __init__(self, **kwargs):
+    @requires_authentication
+    def get_all_grades(self, sites=None, max_workers=None):
         """
-        Encapsulates the raw JSON dictionary that represents a site in TSquare.
-        Converts a dictionary to attributes of an object for ease of use.
-        This constructor should never be called directly; instead, it is called
-        by get_sites.
+        Gets the grades of several sites concurrently. See get_all_assignments
+        for the meaning of the parameters and of the returned dictionary.
         """
-        for key in kwargs:
-            setattr(self, key, kwargs[key])
+        return self._fetch_all(self.get_grades, sites, max_workers)
 
-class TSquareAnnouncement:
-    def __init__(self, **kwargs):
+    @requires_authentication
+    def get_all_syllabi(self, sites=None, max_workers=None):
         """
-        Encapsulates the raw JSON dictionary that represents an announcement
-        in TSquare.
-        Converts a dictionary to attributes of an object for ease of use.
-        This constructor should never be called directly; instead, it is called
-        by get_announcements.
+        Gets the syllabus of several sites concurrently. See
+        get_all_assignments for the meaning of the parameters and of the
+        returned dictionary.
         """
-        for key in kwargs:
-            setattr(self, key, kwargs[key])
+        return self._fetch_all(self.get_syllabus, sites, max_workers)
 
-class TSquareTool:
-    def __init__(self, **kwargs):
+    def _fetch_all(self, func, sites, max_workers):
         """
-        Encapsulates the raw JSON dictionary that represents a tool in TSquare.
-        A tool is any third party application that TSquare uses to provide a
-        service. In this case, assignments, grades, and resources are the most
-        common tools in use.
+        Calls func once per site on a bounded thread pool that shares this
+        object's session, capturing per-site exceptions instead of letting
+        one bad site fail the whole batch.
         """
-        for key in kwargs:
-            setattr(self, key, kwargs[key])
+        if sites is None:
+            sites = self.get_sites()
+        if not sites:
+            return {}
+        max_workers = max_workers or self.max_workers
+        def _fetch_one(site):
+            try:
+                return site.id, func(site)
+            except Exception as e:
+                return site.id, e
+        # imported here, since multiprocessing is slow to import and most
+        # programs never fetch in bulk
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(max(1, min(max_workers, len(sites))))
+        try:
+            return dict(pool.map(_fetch_one, sites))
+        finally:
+            pool.close()
+            pool.join()
+
+
+class TSquareModel(object):
+    """
+    Base class of the objects that wrap TSquare's JSON responses and the
+    dictionaries built by scraping. The keys a model is known to have are
+    stored in __slots__, any other keys in an overflow dictionary, and
+    both are read and written as attributes. Keys missing from the data
+    aren't attributes of the object at all, as with a plain object.
+    """
+    __slots__ = ('_extra',)
+    _fields = frozenset()
 
-class TSquareAssignment:
     def __init__(self, **kwargs):
+        self._update(kwargs)
+
+    @classmethod
+    def from_dict(cls, data):
         """
-        Encapsulates the dictionary that this module builds by scraping the
-        Assignments page. An assignment is anything that can be turned
-        in according to TSquare.
+        Builds a model straight from a decoded dictionary, without copying
+        it into keyword arguments first.
         """
-        for key in kwargs:
-            setattr(self, key, kwargs[key])
-        
-def _get_ticket(username, password):
+        obj = cls.__new__(cls)
+        obj._update(data)
+        return obj
+
+    def _update(self, data):
+        extra = None
+        for key in data:
+            if key in self._fields:
+                object.__setattr__(self, key, data[key])
+            else:
+                if extra is None:
+                    extra = {}
+                extra[key] = data[key]
+        object.__setattr__(self, '_extra', extra)
+
+    def __getattr__(self, name):
+        # only called for unknown keys and for fields that were never set
+        if name != '_extra':
+            extra = self._extra
+            if extra is not None and name in extra:
+                return extra[name]
+        raise AttributeError("'{}' object has no attribute '{}'"
+                             .format(type(self).__name__, name))
+
+    def __setattr__(self, name, value):
+        if name in self._fields:
+            object.__setattr__(self, name, value)
+        else:
+            if self._extra is None:
+                object.__setattr__(self, '_extra', {})
+            self._extra[name] = value
+
+    def __delattr__(self, name):
+        if name in self._fields:
+            object.__delattr__(self, name)
+        elif self._extra is not None and name in self._extra:
+            del self._extra[name]
+        else:
+            raise AttributeError(name)
+
+    def to_dict(self):
+        """
+        Returns the data this object was built from, as a new dictionary.
+        """
+        data = dict(self._extra) if self._extra else {}
+        for key in self._fields:
+            try:
+                data[key] = object.__getattribute__(self, key)
+            except AttributeError:
+                pass
+        return data
+
+    def list_attrs(self):
+        return self.to_dict().keys()
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self._update(state)
+
+
+class TSquareUser(TSquareModel):
+    """
+    Encapsulates the raw JSON dictionary that represents a user in TSquare.
+    Converts a dictionary to attributes of an object for ease of use.
+    This constructor should never be called directly; instead, it is
+    called by get_user_info.
+    """
+    __slots__ = ('createdTime', 'displayId', 'displayName', 'eid', 'email',
+                 'entityId', 'entityReference', 'entityTitle', 'entityURL',
+                 'firstName', 'id', 'lastModified', 'lastName', 'modifiedTime',
+                 'owner', 'props', 'reference', 'sortName', 'type', 'url')
+    _fields = frozenset(__slots__)
+
+class TSquareSite(TSquareModel):
+    """
+    Encapsulates the raw JSON dictionary that represents a site in TSquare.
+    Converts a dictionary to attributes of an object for ease of use.
+    This constructor should never be called directly; instead, it is called
+    by get_sites.
+    """
+    __slots__ = ('activeEdit', 'createdDate', 'createdTime',
+                 'customPageOrdered', 'description', 'empty', 'entityId',
+                 'entityReference', 'entityTitle', 'entityURL', 'iconFullUrl',
+                 'iconUrl', 'iconUrlFull', 'id', 'infoUrl', 'infoUrlFull',
+                 'joinable', 'joinerRole', 'lastModified', 'maintainRole',
+                 'modifiedDate', 'modifiedTime', 'owner', 'props',
+                 'providerGroupId', 'pubView', 'published', 'reference',
+                 'shortDescription', 'siteGroups', 'siteOwner', 'skin',
+                 'title', 'type', 'userRoles')
+    _fields = frozenset(__slots__)
+
+class TSquareAnnouncement(TSquareModel):
+    """
+    Encapsulates the raw JSON dictionary that represents an announcement
+    in TSquare.
+    Converts a dictionary to attributes of an object for ease of use.
+    This constructor should never be called directly; instead, it is called
+    by get_announcements.
+    """
+    __slots__ = ('attachments', 'body', 'createdByDisplayName', 'createdOn',
+                 'entityId', 'entityReference', 'entityTitle', 'entityURL',
+                 'id', 'siteId', 'siteTitle', 'title')
+    _fields = frozenset(__slots__)
+
+class TSquareTool(TSquareModel):
+    """
+    Encapsulates the raw JSON dictionary that represents a tool in TSquare.
+    A tool is any third party application that TSquare uses to provide a
+    service. In this case, assignments, grades, and resources are the most
+    common tools in use.
+    """
+    __slots__ = ('desc', 'href', 'name')
+    _fields = frozenset(__slots__)
+
+class TSquareAssignment(TSquareModel):
+    """
+    Encapsulates the dictionary that this module builds by scraping the
+    Assignments page. An assignment is anything that can be turned
+    in according to TSquare.
+    """
+    __slots__ = ('dueDate', 'href', 'openDate', 'status', 'title')
+    _fields = frozenset(__slots__)
+
+def _get_ticket(username, password, session=requests):
     # step 1 - get a CAS ticket
     data = { 'username' : username, 'password' : password }
-    response = requests.post(BASE_URL_GATECH + 'rest/tickets', data=data)
+    response = session.post(BASE_URL_GATECH + 'rest/tickets', data=data)
     if response.status_code == 400:
         raise TSquareAuthException('Username or password incorrect')
     elif not response.status_code == 201:
@@ -327,21 +1049,58 @@ def _get_ticket(username, password):
     # black magic to strip the ticket out of the raw html response
     form_split = response.text.split('<form action="')[1].split(' ')[0]
     ticket = form_split.split('tickets/')[1][:-1]
+    return ticket, _get_service_ticket(ticket, session)
+
+
+def _get_service_ticket(ticket, session=requests):
     # step 2 - get a TSquare service ticket
     data = { 'service' : SERVICE }
-    response = requests.post(BASE_URL_GATECH + 'rest/tickets/{}'.format(ticket),
-                             data=data)
+    response = session.post(BASE_URL_GATECH + 'rest/tickets/{}'.format(ticket),
+                            data=data)
     if response.status_code == 400:
         raise TSquareAuthException('Parameters missing from ST call')
     elif not response.status_code == 200:
         raise TSquareAuthException('Received unexpected HTTP code: {}'
                                    .format(response.status_code))
-    service_ticket = response.text
-    return ticket, service_ticket
+    return response.text
+
+
+def _build_site(site):
+    t_site = TSquareSite.from_dict(site)
+    if not hasattr(t_site, "props"):
+        t_site.props = {}
+    if not 'banner-crn' in t_site.props:
+        t_site.props['banner-crn'] = None
+    if not 'term' in t_site.props:
+        t_site.props['term'] = None
+    if not 'term_eid' in t_site.props:
+        t_site.props['term_eid'] = None
+    return t_site
+
+
+def _announcement_url(site, num, age):
+    url = BASE_URL_TSQUARE + 'announcement/'
+    if site:
+        return url + 'site/{}.json?n={}&d={}'.format(site.id, num, age)
+    return url + 'user.json?n={}&d={}'.format(num, age)
+
+
+def _release(response):
+    """
+    Hands a streamed response's connection back to the pool.
+    """
+    if not response.raw.closed:
+        # the rest of the body was never read, so this connection can't
+        # be reused for keep-alive
+        connection = getattr(response.raw, '_connection', None)
+        if connection is not None:
+            connection.close()
+    response.close()
 
 
-def _tsquare_login(service_ticket):
-    session = requests.Session()
+def _tsquare_login(service_ticket, session=None):
+    if session is None:
+        session = requests.Session()
     # step 3 - redeem the ticket with TSquare and receive authenticated session
     session.get(SERVICE + '?ticket={}'.format(service_ticket))
     return session
@@ -0,0 +1,79 @@
+import imp
+import importlib
+import json
+
+
+def _installed(module):
+    # finding a module is enough to tell whether it's installed, without
+    # paying for importing it
+    try:
+        imp.find_module(module)
+        return True
+    except ImportError:
+        return False
+
+SIMPLEJSON_AVAILABLE = _installed('simplejson')
+UJSON_AVAILABLE = _installed('ujson')
+
+
+class _LazyDecoder(object):
+    """
+    The loads function of a module that is only imported when it is first
+    needed, so that importing tsquare doesn't import every JSON library
+    installed.
+    """
+
+    def __init__(self, module):
+        self.module = module
+        self._loads = None
+
+    def load(self):
+        """
+        Imports the module, if it isn't yet, and returns its loads.
+        """
+        if self._loads is None:
+            self._loads = importlib.import_module(self.module).loads
+        return self._loads
+
+    def __call__(self, body):
+        return self.load()(body)
+
+# JSON decoders usable by TSquareAPI, keyed by name. Each takes the body of
+# a response, as bytes or text, and returns the decoded value.
+REGISTERED_DECODERS = {'json': json.loads}
+if SIMPLEJSON_AVAILABLE:
+    REGISTERED_DECODERS['simplejson'] = _LazyDecoder('simplejson')
+if UJSON_AVAILABLE:
+    REGISTERED_DECODERS['ujson'] = _LazyDecoder('ujson')
+
+# the order 'auto' tries the decoders in, fastest first
+_PREFERENCE = ('ujson', 'simplejson', 'json')
+
+
+def get_decoder(decoder=None):
+    """
+    Returns a JSON decoding function.
+    @param decoder - The name of a registered decoder, 'auto' for the
+                     fastest one installed, a function taking the body of a
+                     response and returning the decoded value, or None for
+                     the standard library's json module.
+    @throws ValueError - If no decoder of that name is installed
+    """
+    if decoder is None:
+        return json.loads
+    if callable(decoder):
+        return decoder
+    if decoder == 'auto':
+        for name in _PREFERENCE:
+            if name in REGISTERED_DECODERS:
+                return _resolve(REGISTERED_DECODERS[name])
+    if decoder not in REGISTERED_DECODERS:
+        raise ValueError('JSON decoder {} is not installed'.format(decoder))
+    return _resolve(REGISTERED_DECODERS[decoder])
+
+
+def _resolve(decoder):
+    # the function itself, so that decoding doesn't go through a wrapper
+    if isinstance(decoder, _LazyDecoder):
+        return decoder.load()
+    return decoder
@@ -0,0 +1,149 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+
+from cache import TTLCache
+
+
+class CacheBackend(object):
+    """
+    Storage for HTTPCache entries. An entry is a dictionary holding the
+    body of a response, as bytes, and the validators (ETag and Last-Modified) that
+    were sent with it.
+    """
+
+    def get(self, key):
+        raise NotImplementedError('Subclasses of CacheBackend should override this method')
+
+    def set(self, key, entry):
+        raise NotImplementedError('Subclasses of CacheBackend should override this method')
+
+    def delete(self, key):
+        raise NotImplementedError('Subclasses of CacheBackend should override this method')
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    Keeps entries in memory, evicting the least recently used entry once
+    max_entries entries are stored.
+    """
+
+    def __init__(self, max_entries=256):
+        self._entries = TTLCache(ttl=None, max_size=max_entries)
+
+    def get(self, key):
+        return self._entries.get(key)
+
+    def set(self, key, entry):
+        self._entries.set(key, entry)
+
+    def delete(self, key):
+        self._entries.invalidate(key)
+
+
+class FileCacheBackend(CacheBackend):
+    """
+    Keeps entries as JSON files in a directory, so that they survive
+    process restarts and can be shared by several worker processes.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                entry = json.load(f)
+            # JSON has no bytes, so the body is stored in base64
+            entry['content'] = base64.b64decode(entry['content'])
+            return entry
+        except (IOError, ValueError, KeyError, TypeError):
+            return None
+
+    def set(self, key, entry):
+        entry = dict(entry, content=base64.b64encode(entry['content']))
+        # write to a temporary file first so readers never see half an entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            json.dump(entry, f)
+        os.rename(tmp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+
+class HTTPCache(object):
+    """
+    A conditional-request cache for GET requests. Responses carrying an
+    ETag or Last-Modified header are stored, later requests for the same
+    URL send If-None-Match/If-Modified-Since, and a 304 Not Modified reply
+    is answered from the stored body instead of being downloaded again.
+    """
+
+    def __init__(self, backend=None):
+        """
+        Initialize an HTTPCache.
+        @param backend (CacheBackend) - Where entries are stored. Defaults
+                                        to a MemoryCacheBackend.
+        """
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, session, url, key=None, check=None):
+        """
+        GETs url with session, revalidating any stored copy of it.
+        @param session - The requests.Session to send the request with
+        @param url - The URL to fetch
+        @param key - The key the response is stored under. Defaults to url;
+                     callers sharing a backend between users should make
+                     the key unique per user.
+        @param check - If given, called with every response before it is
+                       used, e.g. to raise if it shows the session expired.
+        @returns The body of the response, as bytes. It isn't decoded to
+                 text, so the caller doesn't pay for guessing its encoding.
+        @throws requests.HTTPError - If the response is neither a success
+                                     nor a 304 for a stored entry.
+        """
+        key = key or url
+        entry = self.backend.get(key)
+        headers = {}
+        if entry is not None:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        response = session.get(url, headers=headers)
+        if check is not None:
+            check(response)
+        if response.status_code == 304 and entry is not None:
+            self.hits += 1
+            return entry['content']
+        response.raise_for_status()
+        self.misses += 1
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if etag or last_modified:
+            self.backend.set(key, {'etag': etag,
+                                   'last_modified': last_modified,
+                                   'content': response.content})
+        else:
+            self.backend.delete(key)
+        return response.content
+
+    def invalidate(self, key):
+        """
+        Discards the entry stored under key.
+        """
+        self.backend.delete(key)
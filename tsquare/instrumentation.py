@@ -0,0 +1,204 @@
+from collections import deque
+import threading
+import time
+
+# the public TSquareAPI methods running on each thread, outermost first
+_calls = threading.local()
+
+
+class Instrumentation(object):
+    """
+    Receives the timings TSquareAPI measures. Subclass it and override
+    record to forward timings to a metrics system.
+
+    Phases are 'total' (a whole public method), 'login' (one step of the
+    CAS flow), 'http' (waiting for and downloading a response), 'stream'
+    (downloading and scraping a streamed page), 'parse' (decoding JSON or
+    scraping html), 'build' (constructing model objects) and 'store'
+    (writing fetched data to a store.DataStore).
+    """
+
+    def record(self, method, phase, duration, **info):
+        """
+        Called once per measured phase.
+        @param method - The outermost public TSquareAPI method running on
+                        this thread, e.g. 'get_assignments'
+        @param phase - The phase that was measured
+        @param duration - The time the phase took, in seconds
+        @param info - Details of the phase: 'url' and 'bytes' for requests,
+                      'scraper' for parsing, 'count' for model building,
+                      'kind' (and 'error', if the write failed) for
+                      storing.
+        """
+        pass
+
+
+class CallbackInstrumentation(Instrumentation):
+    """
+    Forwards every timing to a function taking the same arguments as
+    Instrumentation.record.
+    """
+
+    def __init__(self, callback):
+        self.callback = callback
+
+    def record(self, method, phase, duration, **info):
+        self.callback(method, phase, duration, **info)
+
+
+class MetricsAggregator(Instrumentation):
+    """
+    Keeps the most recent timings of every (method, phase) pair in memory
+    and reports percentiles of them.
+    """
+
+    def __init__(self, max_samples=1024):
+        """
+        @param max_samples - How many of the most recent timings are kept
+                             per (method, phase) pair.
+        """
+        self.max_samples = max_samples
+        self._samples = {}
+        self._counts = {}
+        self._bytes = {}
+        self._lock = threading.Lock()
+
+    def record(self, method, phase, duration, **info):
+        key = (method, phase)
+        with self._lock:
+            if key not in self._samples:
+                self._samples[key] = deque(maxlen=self.max_samples)
+                self._counts[key] = 0
+                self._bytes[key] = 0
+            self._samples[key].append(duration)
+            self._counts[key] += 1
+            self._bytes[key] += info.get('bytes', 0)
+
+    def percentile(self, method, phase, percent):
+        """
+        Returns the percent-th percentile of the recent timings of phase
+        within method, in seconds, or None if none were recorded.
+        """
+        with self._lock:
+            samples = sorted(self._samples.get((method, phase), ()))
+        return _percentile(samples, percent)
+
+    def summary(self, percents=(50, 90, 99)):
+        """
+        Returns a dictionary mapping each (method, phase) pair to its total
+        call count, total bytes received, and the percentiles of its recent
+        timings keyed like 'p50', in seconds.
+        """
+        # copied under the lock, since record and reset change them from
+        # other threads
+        with self._lock:
+            samples = dict((key, sorted(values))
+                           for key, values in self._samples.items())
+            counts = dict(self._counts)
+            received = dict(self._bytes)
+        out = {}
+        for key in samples:
+            stats = {'count': counts[key], 'bytes': received[key]}
+            for percent in percents:
+                stats['p{}'.format(percent)] = _percentile(samples[key],
+                                                           percent)
+            out[key] = stats
+        return out
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._counts.clear()
+            self._bytes.clear()
+
+    def __getstate__(self):
+        return {'max_samples': self.max_samples}
+
+    def __setstate__(self, state):
+        self.__init__(state['max_samples'])
+
+
+def _percentile(samples, percent):
+    # samples must be sorted
+    if not samples:
+        return None
+    index = int(round(percent / 100.0 * (len(samples) - 1)))
+    return samples[index]
+
+
+def current_method():
+    """
+    Returns the outermost public TSquareAPI method running on this thread.
+    """
+    stack = getattr(_calls, 'stack', None)
+    return stack[0] if stack else None
+
+
+class _Timer(object):
+    __slots__ = ('instrumentation', 'phase', 'info', 'start')
+
+    def __init__(self, instrumentation, phase, info):
+        self.instrumentation = instrumentation
+        self.phase = phase
+        self.info = info
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.instrumentation.record(current_method(), self.phase,
+                                    time.time() - self.start, **self.info)
+
+
+class _NullTimer(object):
+    __slots__ = ('info',)
+
+    def __init__(self):
+        self.info = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.info.clear()
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(instrumentation, phase, **info):
+    """
+    Returns a context manager that measures its block as phase and reports
+    it to instrumentation. Details only known inside the block can be
+    added to the returned timer's info dictionary. If instrumentation is
+    None, nothing is measured.
+    """
+    if instrumentation is None:
+        return _NULL_TIMER
+    return _Timer(instrumentation, phase, info)
+
+
+def traced(func):
+    """
+    Method decorator that marks func as a public TSquareAPI method and, if
+    its object has instrumentation, reports the whole call as 'total'.
+    """
+    def _traced(self, *args, **kwargs):
+        instrumentation = self._instrumentation
+        if instrumentation is None:
+            return func(self, *args, **kwargs)
+        stack = getattr(_calls, 'stack', None)
+        if stack is None:
+            stack = _calls.stack = []
+        stack.append(func.__name__)
+        start = time.time()
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            duration = time.time() - start
+            stack.pop()
+            instrumentation.record(func.__name__, 'total', duration)
+    _traced.__name__ = func.__name__
+    _traced.__doc__ = func.__doc__
+    return _traced
@@ -1,14 +1,23 @@
+from collections import namedtuple
 from copy import deepcopy
+from datetime import datetime
 import HTMLParser
+import imp
 import re
+import threading
 
+# BeautifulSoup is only imported once a scraper that needs it is used;
+# finding it is enough to tell whether it's installed
 try:
-    from BeautifulSoup import BeautifulSoup as soup
+    imp.find_module('BeautifulSoup')
     BS_AVAILABLE = True
 except ImportError:
-    print "WARNING - BS4 NOT AVAILABLE"
     BS_AVAILABLE = False
 
+# the entry point group third-party packages register scrapers under, e.g.
+#     entry_points={'tsquare.parsers': ['fast = fastparse:FastParser']}
+ENTRY_POINT_GROUP = 'tsquare.parsers'
+
 class HTMLScraperInterface(object):
     def get_iframes(self, html_in):
         raise NotImplementedError('Subclasses of HTMLScraperInterface should override this method')
@@ -22,10 +31,49 @@ class HTMLScraperInterface(object):
     def get_grades(self, html_in):
         raise NotImplementedError('Subclasses of HTMLScraperInterface should override this method')
 
+    def get_grade_records(self, html_in):
+        """
+        Scrapes a gradebook page in a single pass into a Gradebook of typed
+        GradeRecords, rather than the nested dictionaries of strings that
+        get_grades returns. Every scraper shares this implementation.
+        """
+        return _grade_records(_gradebook_parser().parse(html_in))
+
+    def stream_iframes(self, chunks, title=None):
+        """
+        Like get_iframes, but reads the page from an iterable of text chunks.
+        Scrapers that parse incrementally stop reading chunks once an iframe
+        titled title (or any iframe, if title is None) has been found; this
+        one reads the whole page first.
+        """
+        return self.get_iframes(u''.join(chunks))
+
+    def stream_tools(self, chunks):
+        """
+        Like get_tools, but reads the page from an iterable of text chunks.
+        Scrapers that parse incrementally stop reading chunks once the tool
+        menu has been read; this one reads the whole page first.
+        """
+        return self.get_tools(u''.join(chunks))
+
 class LXMLParser(HTMLScraperInterface):
-    
+
+    # the only elements each method looks at, as SoupStrainer arguments
+    _IFRAMES_ONLY = ('iframe',)
+    _TOOLS_ONLY = ('a', {'class': re.compile('^icon-sakai')})
+    _TABLES_ONLY = ('table',)
+
+    def _soup(self, html_in, only):
+        """
+        Builds the tree that a method scrapes. only names the elements
+        the method needs; this parser ignores it and builds the whole
+        document.
+        """
+        from BeautifulSoup import BeautifulSoup
+        return BeautifulSoup(html_in)
+
     def get_iframes(self, html_in):
-        doc = soup(html_in)
+        doc = self._soup(html_in, self._IFRAMES_ONLY)
         frame_attrs = dict(doc.iframe.attrs)
         return [{'name' : frame_attrs['name'],
                  'title': frame_attrs['title'],
@@ -33,7 +81,7 @@ class LXMLParser(HTMLScraperInterface):
             
 
     def get_tools(self, html_in):
-        doc = soup(html_in)
+        doc = self._soup(html_in, self._TOOLS_ONLY)
         out_dict_list = []
         for tab in doc.findAll('a'):
             class_type = tab.get('class')
@@ -44,7 +92,7 @@ class LXMLParser(HTMLScraperInterface):
         return out_dict_list
         
     def get_assignments(self, html_in):
-        doc = soup(html_in)
+        doc = self._soup(html_in, self._TABLES_ONLY)
         out_list = []
         table = doc.table
         for i, table_row in enumerate(table('tr')):
@@ -61,7 +109,7 @@ class LXMLParser(HTMLScraperInterface):
         return out_list
 
     def get_grades(self, html_in):
-        doc = soup(html_in)
+        doc = self._soup(html_in, self._TABLES_ONLY)
         out_dict = {}
         tables = doc.findAll('table')
         # tables[0] is the header that we don't care about
@@ -117,20 +165,78 @@ class LXMLParser(HTMLScraperInterface):
         return out_dict
 
     def get_syllabus(self, html_in):
-        soup_html = soup(html_in)
+        soup_html = self._soup(html_in, self._TABLES_ONLY)
         table = soup_html('table')
         html = table.__repr__()[1:-1] # SERIOUSLY beautifulsoup????
         return html
 
+
+class StrainedParser(LXMLParser):
+    """
+    The BeautifulSoup scraper, but only the elements each method looks at
+    (iframes, tool links or tables) are built into the tree, which saves
+    most of the time and memory spent on large portal and gradebook
+    pages. Returns exactly what LXMLParser returns.
+    """
+
+    def _soup(self, html_in, only):
+        from BeautifulSoup import BeautifulSoup, SoupStrainer
+        return BeautifulSoup(html_in, parseOnlyThese=SoupStrainer(*only))
+
+
 class DefaultParser(HTMLScraperInterface):
+    """
+    Scrapes pages with the standard library's HTMLParser. Each thread
+    keeps one instance of every parser class and purges it before each
+    use, so a DefaultParser can be shared between threads and parsers
+    aren't rebuilt for every page.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _parser(self, parser_class):
+        parser = getattr(self._local, parser_class.__name__, None)
+        if parser is None:
+            parser = parser_class()
+            setattr(self._local, parser_class.__name__, parser)
+        else:
+            parser.purge()
+        return parser
+
     def get_iframes(self, html_in):
-        return _IFrameParser().get_iframes(html_in)
+        return self._parser(_IFrameParser).get_iframes(html_in)
 
     def get_tools(self, html_in):
-        return _SiteToolHTMLParser().get_tools(html_in)
+        return self._parser(_SiteToolHTMLParser).get_tools(html_in)
 
     def get_assignments(self, html_in):
-        return _AssignmentHTMLParser().get_assignments(html_in)
+        return self._parser(_AssignmentHTMLParser).get_assignments(html_in)
+
+    def get_grades(self, html_in):
+        return _grades_dict(_gradebook_parser().parse(html_in))
+
+    def stream_iframes(self, chunks, title=None):
+        parser = self._parser(_IFrameParser)
+        iframes = []
+        for chunk in chunks:
+            iframes = parser.get_iframes(chunk)
+            if parser.has_iframe(title):
+                break
+        return iframes
+
+    def stream_tools(self, chunks):
+        parser = self._parser(_SiteToolHTMLParser)
+        tools = []
+        for chunk in chunks:
+            tools = parser.get_tools(chunk)
+            if parser.past_tool_menu():
+                break
+        return tools
+
+    def __reduce__(self):
+        # per-thread parsers can't be pickled; they're rebuilt on demand
+        return (self.__class__, ())
 
         
 class _IFrameParser(HTMLParser.HTMLParser):
@@ -148,6 +254,20 @@ class _IFrameParser(HTMLParser.HTMLParser):
     def get_iframes(self, html_input):
         self.feed(html_input)
         return self._iframes
+
+    def has_iframe(self, title=None):
+        """
+        Returns True if an iframe titled title (or any iframe, if title is
+        None) has been parsed so far.
+        """
+        for frame in self._iframes:
+            if title is None or frame['title'] == title.strip():
+                return True
+        return False
+
+    def purge(self):
+        self.reset()
+        self._iframes = []
     
     
 class _SiteToolHTMLParser(HTMLParser.HTMLParser):
@@ -155,9 +275,13 @@ class _SiteToolHTMLParser(HTMLParser.HTMLParser):
     def __init__(self):
         HTMLParser.HTMLParser.__init__(self)
         self._tools = []
+        self._past_tool_menu = False
 
     def handle_starttag(self, tag, attrs):
         first_attr = dict(attrs)
+        if tag == 'iframe':
+            # the portal's tool menu comes before the content iframes
+            self._past_tool_menu = True
         # if this is a link with a class attribute
         if tag == 'a' and 'class' in first_attr:
             # look for tools
@@ -182,8 +306,17 @@ class _SiteToolHTMLParser(HTMLParser.HTMLParser):
         self.feed(html_text)
         return self._tools
 
+    def past_tool_menu(self):
+        """
+        Returns True once the parser has reached the page content, after
+        which no more tools are listed.
+        """
+        return self._past_tool_menu
+
     def purge(self):
+        self.reset()
         self._tools = []
+        self._past_tool_menu = False
 
 class _AssignmentHTMLParser(HTMLParser.HTMLParser):
 
@@ -259,9 +392,337 @@ class _AssignmentHTMLParser(HTMLParser.HTMLParser):
         return self._assignments
 
     def purge(self):
+        self.reset()
         self._assignments = []
         self._constructed_obj = {}
         self._state = self._PARSER_STATE[0]
+        self._lstate = self._LEXER_STATE[0]
         
-REGISTERED_METHODS = { 'default' : DefaultParser,
-                       'bs4'     : LXMLParser }
\ No newline at end of file
+
+# A gradebook: course_grade is a CourseGrade, or None if the grade isn't
+# available yet, and records is a tuple of GradeRecords in page order.
+Gradebook = namedtuple('Gradebook', ['course_grade', 'records'])
+
+# letter is the letter grade as shown, percent a float (93.5 for '93.50%')
+# or None.
+CourseGrade = namedtuple('CourseGrade', ['letter', 'percent'])
+
+# One graded item. category is None for items outside any category. grade
+# is the grade as shown ('41.5/50'), score and possible its numbers (41.5
+# and 50.0) or None if it isn't numeric, date a datetime.date or None.
+GradeRecord = namedtuple('GradeRecord', ['category', 'name', 'score',
+                                         'possible', 'grade', 'date',
+                                         'comments'])
+
+
+class _GradebookHTMLParser(HTMLParser.HTMLParser):
+    """
+    Reads a gradebook page in one pass. The second table on the page holds
+    the course grade, the third the graded items: a row with a span starts
+    a category, and the other rows hold the name, date, grade, comments
+    and attachments of an item, one per cell. Like BeautifulSoup's text,
+    each run of text between tags is stripped, and entities are kept as
+    they appear in the page.
+    """
+
+    def __init__(self):
+        HTMLParser.HTMLParser.__init__(self)
+        self.purge()
+
+    def purge(self):
+        self.reset()
+        self._tables = 0
+        self._open_tables = []
+        self._course_spans = []
+        self._span_depth = 0
+        self._items = []
+        self._category = None
+        self._cell = None
+        self._fields = []
+        self._text = []
+
+    def parse(self, html_input):
+        """
+        @returns (course, items) where course is the list of texts of the
+                 spans in the course grade table, and items is a list of
+                 (category, name, date, grade, comments) tuples of strings.
+        """
+        self.feed(html_input)
+        self.close()
+        return self._course_spans, self._items
+
+    def handle_starttag(self, tag, attrs):
+        self._end_text()
+        if tag == 'table':
+            self._open_tables.append(self._tables)
+            self._tables += 1
+        elif tag == 'span':
+            if self._span_depth:
+                self._span_depth += 1
+            elif 1 in self._open_tables:
+                self._course_spans.append([])
+                self._span_depth = 1
+            elif self._cell is not None and self._cell['span'] is None:
+                self._cell['span'] = []
+                self._span_depth = 1
+        elif tag == 'td' and 2 in self._open_tables:
+            self._cell = {'text': [], 'span': None, 'img': False,
+                          'left': dict(attrs).get('class') == 'left'}
+        elif tag == 'img' and self._cell is not None:
+            self._cell['img'] = True
+
+    def handle_endtag(self, tag):
+        self._end_text()
+        if tag == 'table' and self._open_tables:
+            self._open_tables.pop()
+        elif tag == 'span' and self._span_depth:
+            self._span_depth -= 1
+        elif tag == 'td' and self._cell is not None:
+            self._end_cell(self._cell)
+            self._cell = None
+
+    def handle_data(self, data):
+        # HTMLParser splits text at entities, BeautifulSoup doesn't
+        self._text.append(data)
+
+    def handle_comment(self, data):
+        # a comment is text of its own to BeautifulSoup
+        self._end_text()
+        self._text.append(data)
+        self._end_text()
+
+    def _end_text(self):
+        if not self._text:
+            return
+        data = u''.join(self._text).strip()
+        self._text = []
+        if self._span_depth and 1 in self._open_tables:
+            self._course_spans[-1].append(data)
+        elif self._cell is not None:
+            self._cell['text'].append(data)
+            if self._span_depth:
+                self._cell['span'].append(data)
+
+    def handle_entityref(self, name):
+        self.handle_data('&{};'.format(name))
+
+    def handle_charref(self, name):
+        self.handle_data('&#{};'.format(name))
+
+    def _end_cell(self, cell):
+        # the same state machine as LXMLParser.get_grades, one cell at a time
+        fields = self._fields
+        if cell['img']:
+            return
+        if cell['span'] is not None:
+            self._category = u''.join(cell['span']).strip()
+            self._items.append((self._category, None))
+        elif cell['left'] and not fields:
+            fields.append(u''.join(cell['text']))
+        elif 0 < len(fields) < 4:
+            fields.append(u''.join(cell['text']))
+        elif len(fields) == 4:
+            self._items.append((self._category, tuple(fields)))
+            self._fields = []
+
+    def close(self):
+        HTMLParser.HTMLParser.close(self)
+        self._end_text()
+        self._course_spans = [u''.join(x) for x in self._course_spans]
+
+
+_local = threading.local()
+
+
+def _gradebook_parser():
+    # one gradebook parser per thread, purged before each use
+    parser = getattr(_local, 'gradebook', None)
+    if parser is None:
+        parser = _local.gradebook = _GradebookHTMLParser()
+    else:
+        parser.purge()
+    return parser
+
+
+def _grades_dict(parsed):
+    # the dictionary LXMLParser.get_grades returns
+    course, items = parsed
+    out_dict = {}
+    if course:
+        out_dict['course_grade'] = {'letter_grade': course[0],
+                                    'number_grade': course[1]}
+    else:
+        out_dict['course_grade'] = {'error': 'Not yet available'}
+    grades = out_dict['grades'] = {}
+    for category, fields in items:
+        if fields is None:
+            grades.setdefault(category, [])
+            continue
+        name, date, grade, comments = fields
+        grades.setdefault(category or 'unnamed', []).append({'name': name, 'date': date,
+                                                'grade': grade,
+                                                'comments': comments})
+    return out_dict
+
+
+def _grade_records(parsed):
+    course, items = parsed
+    course_grade = None
+    if course:
+        course_grade = CourseGrade(_unescape(course[0]).strip(),
+                                   _number(course[1].strip().rstrip('%'))
+                                   if len(course) > 1 else None)
+    records = []
+    for category, fields in items:
+        if fields is None:
+            continue
+        name, date, grade, comments = [_unescape(x).strip() for x in fields]
+        score, _, possible = grade.partition('/')
+        records.append(GradeRecord(_unescape(category) if category else None,
+                                   name, _number(score), _number(possible),
+                                   grade, _date(date), comments))
+    return Gradebook(course_grade, tuple(records))
+
+
+# get_grades keeps entities as BeautifulSoup does; GradeRecords hold the
+# text as shown
+_unescape = HTMLParser.HTMLParser().unescape
+
+
+def _number(text):
+    try:
+        return float(text)
+    except ValueError:
+        return None
+
+
+def _date(text):
+    try:
+        return datetime.strptime(text, '%b %d, %Y').date()
+    except ValueError:
+        return None
+
+
+class ParserRegistry(object):
+    """
+    The scrapers TSquareAPI can use, by name. A scraper can be registered
+    as a class, or as a 'module:Class' string that is only imported when
+    the scraper is first used, so that unused scrapers cost nothing at
+    startup. Scrapers of other packages are found through the entry point
+    group ENTRY_POINT_GROUP, which is only read when a name isn't
+    registered here, or when every name is listed.
+    """
+
+    def __init__(self, group=ENTRY_POINT_GROUP):
+        self.group = group
+        self._backends = {}
+        self._plugins_loaded = False
+        self._lock = threading.Lock()
+
+    def register(self, name, backend):
+        """
+        Registers backend under name, replacing any scraper of that name.
+        @param backend - A subclass of HTMLScraperInterface, or the
+                         'module:Class' path of one.
+        """
+        with self._lock:
+            self._backends[name] = backend
+
+    def __setitem__(self, name, backend):
+        self.register(name, backend)
+
+    def __getitem__(self, name):
+        """
+        Returns the scraper class registered under name, importing it if
+        it hasn't been used yet.
+        @throws KeyError - If no scraper of that name is registered
+        @throws ImportError - If the scraper or a library it needs can't
+                              be imported
+        """
+        if name not in self._backends:
+            self._load_plugins()
+        with self._lock:
+            backend = self._backends[name]
+        if not isinstance(backend, type):
+            backend = _load(backend)
+            with self._lock:
+                self._backends[name] = backend
+        return backend
+
+    def get(self, name, default=None):
+        """
+        Returns the scraper class registered under name, or default if
+        there is none.
+        """
+        if name not in self:
+            return default
+        return self[name]
+
+    def __contains__(self, name):
+        if name not in self._backends:
+            self._load_plugins()
+        return name in self._backends
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def keys(self):
+        self._load_plugins()
+        with self._lock:
+            return list(self._backends)
+
+    def items(self):
+        """
+        Returns (name, scraper class) pairs for every registered scraper,
+        importing any that haven't been used yet.
+        """
+        return [(name, self[name]) for name in self.keys()]
+
+    def _load_plugins(self):
+        if self._plugins_loaded:
+            return
+        try:
+            # pkg_resources is slow to import, so it's only imported here
+            import pkg_resources
+            entry_points = list(pkg_resources.iter_entry_points(self.group))
+        except ImportError:
+            entry_points = []
+        with self._lock:
+            for entry_point in entry_points:
+                self._backends.setdefault(entry_point.name, entry_point)
+            self._plugins_loaded = True
+
+
+def _load(backend):
+    # backend is either a 'module:Class' string or an entry point
+    if isinstance(backend, basestring):
+        module_name, class_name = backend.split(':')
+        module = __import__(module_name, fromlist=[class_name])
+        return getattr(module, class_name)
+    return backend.load()
+
+
+# the scraper instances used by scrape, by name
+_scrapers = {}
+
+
+def scrape(scraper, method, html):
+    """
+    Scrapes html with the given method of the scraper registered under the
+    name scraper, and returns the result. This is a module-level function
+    so that it can be sent to a multiprocessing.Pool; each process builds
+    a scraper once and reuses it.
+    """
+    parser = _scrapers.get(scraper)
+    if parser is None:
+        parser = _scrapers[scraper] = REGISTERED_METHODS[scraper]()
+    return getattr(parser, method)(html)
+
+
+REGISTERED_METHODS = ParserRegistry()
+REGISTERED_METHODS.register('default', DefaultParser)
+REGISTERED_METHODS.register('bs4', LXMLParser)
+REGISTERED_METHODS.register('strained', StrainedParser)
\ No newline at end of file
@@ -0,0 +1,234 @@
+from collections import OrderedDict
+import threading
+import time
+
+from core import TSquareAPI, NotAuthenticatedException
+from transport import HTTPTransport
+
+
+class _Client(object):
+    __slots__ = ('api', 'semaphore', 'in_use', 'last_used')
+
+    def __init__(self, api, per_user_concurrency):
+        self.api = api
+        self.semaphore = threading.BoundedSemaphore(per_user_concurrency)
+        self.in_use = 0
+        self.last_used = time.time()
+
+
+def _pooled_method(name):
+    def _method(self, username, *args, **kwargs):
+        return self.call(username, name, *args, **kwargs)
+    _method.__name__ = name
+    _method.__doc__ = """
+        Calls TSquareAPI.{} as username. Accepts the same arguments after
+        the username.
+        @throws NotAuthenticatedException - If username isn't logged in
+        """.format(name)
+    return _method
+
+
+class TSquareClientPool(object):
+    """
+    Serves many users from one process. Every user gets a TSquareAPI with
+    its own cookie jar, but all of them share one HTTPTransport, so the
+    number of open sockets depends on how many requests run at once, not
+    on how many users are logged in. Users that haven't made a call for a
+    while are dropped, least recently used first.
+    """
+
+    def __init__(self, max_clients=1000, max_concurrency=32,
+                 per_user_concurrency=2, idle_timeout=None, transport=None,
+                 credential_provider=None, **kwargs):
+        """
+        Initialize a TSquareClientPool.
+        @param max_clients - How many users are kept logged in. When a new
+                             user logs in past this, the least recently
+                             used idle user is dropped.
+        @param max_concurrency - How many calls may run at once, across
+                                 all users. Later calls wait for a slot.
+        @param per_user_concurrency - How many calls may run at once for
+                                      any one user.
+        @param idle_timeout - If not None, users that haven't made a call
+                              for this many seconds are dropped.
+        @param transport - The HTTPTransport shared by every user. If None,
+                           one keeping max_concurrency connections per host
+                           is created.
+        @param credential_provider - A function taking a username and
+                                     returning its password. If given, a
+                                     dropped user is logged in again on its
+                                     next call instead of raising
+                                     NotAuthenticatedException.
+        Any other keyword arguments are passed on to every TSquareAPI.
+        """
+        self.max_clients = max_clients
+        self.per_user_concurrency = per_user_concurrency
+        self.idle_timeout = idle_timeout
+        self.credential_provider = credential_provider
+        self.transport = transport or HTTPTransport(pool_maxsize=max_concurrency)
+        kwargs.setdefault('credential_provider', credential_provider)
+        self._api_kwargs = kwargs
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # username -> [lock, number of calls using it] for re-logins in
+        # progress
+        self._logins = {}
+
+    def login(self, username, password):
+        """
+        Logs username in and adds it to the pool, replacing any earlier
+        login of the same user.
+        @returns The logged in TSquareAPI
+        @throws TSquareAuthException - If the login fails
+        """
+        with self._slots:
+            api = TSquareAPI(username, password, transport=self.transport,
+                             **self._api_kwargs)
+        self.add(api)
+        return api
+
+    def add(self, api):
+        """
+        Adds an already logged in TSquareAPI to the pool, for example one
+        restored with sessions.load_session(data, transport=pool.transport).
+        """
+        with self._lock:
+            self._clients.pop(api.username, None)
+            self._evict(room=1)
+            self._clients[api.username] = _Client(api,
+                                                  self.per_user_concurrency)
+
+    def remove(self, username):
+        """
+        Drops username from the pool without logging it out of CAS.
+        @returns The TSquareAPI that was dropped, or None
+        """
+        with self._lock:
+            client = self._clients.pop(username, None)
+        return client.api if client is not None else None
+
+    def get(self, username):
+        """
+        Returns the TSquareAPI of username, logging it in again with the
+        credential provider if it was dropped.
+        @throws NotAuthenticatedException - If username isn't logged in
+        """
+        return self._checkout(username, False).api
+
+    def logout(self, username):
+        """
+        Logs username out of CAS and drops it from the pool. A user that
+        isn't in the pool is only forgotten; it isn't logged in again just
+        to be logged out.
+        """
+        with self._lock:
+            client = self._clients.get(username)
+            if client is not None:
+                client.in_use += 1
+        if client is None:
+            self.remove(username)
+            return
+        try:
+            self._run(client, 'logout')
+        finally:
+            self.remove(username)
+
+    def call(self, username, name, *args, **kwargs):
+        """
+        Calls the TSquareAPI method name as username, once both a per-user
+        and a global slot are free.
+        @throws NotAuthenticatedException - If username isn't logged in
+        """
+        return self._run(self._checkout(username, True), name, *args, **kwargs)
+
+    def _run(self, client, name, *args, **kwargs):
+        # client has been checked out for use
+        try:
+            # the per-user slot first, so that a user's queued calls don't
+            # hold global slots other users could be running in
+            with client.semaphore:
+                with self._slots:
+                    return getattr(client.api, name)(*args, **kwargs)
+        finally:
+            with self._lock:
+                client.in_use -= 1
+                client.last_used = time.time()
+
+    def _checkout(self, username, use):
+        with self._lock:
+            self._evict()
+            client = self._clients.get(username)
+            if client is not None:
+                self._clients[username] = self._clients.pop(username)
+                client.last_used = time.time()
+                if use:
+                    client.in_use += 1
+                return client
+        if self.credential_provider is None:
+            raise NotAuthenticatedException('{} is not logged in'
+                                            .format(username))
+        self._relogin(username)
+        return self._checkout(username, use)
+
+    def _relogin(self, username):
+        # calls for a dropped user share a single login
+        with self._lock:
+            entry = self._logins.get(username)
+            if entry is None:
+                entry = self._logins[username] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                if username not in self:
+                    self.login(username, self.credential_provider(username))
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._logins[username]
+
+    def _evict(self, room=0):
+        # called with self._lock held. Clients in the middle of a call are
+        # never dropped, so the pool may briefly exceed max_clients.
+        if self.idle_timeout is not None:
+            cutoff = time.time() - self.idle_timeout
+            for username, client in list(self._clients.items()):
+                if client.in_use == 0 and client.last_used < cutoff:
+                    del self._clients[username]
+        excess = len(self._clients) + room - self.max_clients
+        for username, client in list(self._clients.items()):
+            if excess <= 0:
+                break
+            if client.in_use == 0:
+                del self._clients[username]
+                excess -= 1
+
+    def __contains__(self, username):
+        with self._lock:
+            return username in self._clients
+
+    def __len__(self):
+        with self._lock:
+            return len(self._clients)
+
+    def close(self):
+        """
+        Drops every user and closes the pooled connections.
+        """
+        with self._lock:
+            self._clients.clear()
+        self.transport.close()
+
+    get_user_info = _pooled_method('get_user_info')
+    get_site_by_id = _pooled_method('get_site_by_id')
+    get_sites = _pooled_method('get_sites')
+    get_announcements = _pooled_method('get_announcements')
+    get_tools = _pooled_method('get_tools')
+    invalidate_tools = _pooled_method('invalidate_tools')
+    get_assignments = _pooled_method('get_assignments')
+    get_grades = _pooled_method('get_grades')
+    get_syllabus = _pooled_method('get_syllabus')
+    get_all_assignments = _pooled_method('get_all_assignments')
+    get_all_grades = _pooled_method('get_all_grades')
+    get_all_syllabi = _pooled_method('get_all_syllabi')
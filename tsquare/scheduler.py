@@ -0,0 +1,234 @@
+from urlparse import urlparse
+import random
+import threading
+import time
+
+import requests
+
+RETRY_STATUSES = frozenset([500, 502, 503, 504])
+
+
+class _Host(object):
+    """
+    The token bucket, concurrency slots and statistics of one host.
+    """
+
+    def __init__(self, rate, burst, max_concurrency):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.refilled = time.time()
+        self.slots = (threading.BoundedSemaphore(max_concurrency)
+                      if max_concurrency else None)
+        self.lock = threading.Lock()
+        self.queued = 0
+        self.active = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def take_token(self):
+        """
+        Takes a token from the bucket, or returns how many seconds to wait
+        before one is available.
+        """
+        with self.lock:
+            now = time.time()
+            self.tokens = min(self.burst,
+                              self.tokens + (now - self.refilled) * self.rate)
+            self.refilled = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            return (1 - self.tokens) / self.rate
+
+
+class RequestScheduler(object):
+    """
+    Paces the requests a TSquareAPI (or every TSquareAPI it is shared by)
+    sends to each host. Requests take a token from a per-host bucket that
+    refills at a fixed rate, wait for one of a bounded number of per-host
+    slots, and are retried with jittered exponential backoff when the
+    server answers with a 5xx or the connection fails.
+    """
+
+    def __init__(self, rate=None, burst=None, max_concurrency=None,
+                 retries=3, backoff=0.5, max_backoff=30,
+                 retry_statuses=RETRY_STATUSES):
+        """
+        Initialize a RequestScheduler.
+        @param rate - The number of requests per second allowed to each
+                      host. None means no limit.
+        @param burst - How many requests may be sent to a host at once
+                       after it has been idle. Defaults to rate, or 1 if
+                       rate is smaller than 1.
+        @param max_concurrency - How many requests may be in flight to each
+                                 host at once. None means no limit.
+        @param retries - How many times a failed request is retried.
+        @param backoff - The delay before the first retry, in seconds. Each
+                         later retry waits up to twice as long as the last,
+                         picked at random so that clients don't retry in
+                         lockstep.
+        @param max_backoff - The longest delay between retries, in seconds.
+        @param retry_statuses - The response codes that are retried.
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, rate or 1)
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.retry_statuses = retry_statuses
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def _host(self, url):
+        name = urlparse(url).netloc
+        with self._lock:
+            host = self._hosts.get(name)
+            if host is None:
+                host = self._hosts[name] = _Host(self.rate, self.burst,
+                                                 self.max_concurrency)
+            return host
+
+    def request(self, session, method, url, **kwargs):
+        """
+        Sends a request with session once the host of url allows it,
+        retrying it if it fails.
+        @returns The response. A response with a retryable status is
+                 returned as is once the retries are used up.
+        @throws requests.ConnectionError - If the connection still fails
+                                           after the last retry
+        """
+        host = self._host(url)
+        attempt = 0
+        while True:
+            try:
+                response = self._send(host, session, method, url, kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retries:
+                    with host.lock:
+                        host.failures += 1
+                    raise
+                delay = self._delay(attempt)
+            else:
+                if (response.status_code not in self.retry_statuses or
+                        attempt >= self.retries):
+                    return response
+                delay = self._delay(attempt, response.headers.get('Retry-After'))
+                # read the (short) error body so the connection can be reused
+                response.content
+                response.close()
+            with host.lock:
+                host.retries += 1
+            attempt += 1
+            time.sleep(delay)
+
+    def _send(self, host, session, method, url, kwargs):
+        start = time.time()
+        with host.lock:
+            host.queued += 1
+        if host.slots is not None:
+            host.slots.acquire()
+        try:
+            if host.rate is not None:
+                wait = host.take_token()
+                while wait:
+                    time.sleep(wait)
+                    wait = host.take_token()
+            waited = time.time() - start
+            with host.lock:
+                host.queued -= 1
+                host.active += 1
+                host.requests += 1
+                host.wait_total += waited
+                host.wait_max = max(host.wait_max, waited)
+            try:
+                return session.request(method, url, **kwargs)
+            finally:
+                with host.lock:
+                    host.active -= 1
+        finally:
+            if host.slots is not None:
+                host.slots.release()
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        return random.uniform(0, min(self.max_backoff,
+                                     self.backoff * 2 ** attempt))
+
+    def stats(self):
+        """
+        Returns a dictionary mapping each host contacted to a dictionary of
+        its statistics: 'queued' and 'active' (requests waiting for and
+        holding a slot right now), 'requests', 'retries' and 'failures'
+        (totals so far), and 'wait_total' and 'wait_max' (the time requests
+        spent waiting for a slot and a token, in seconds).
+        """
+        with self._lock:
+            hosts = list(self._hosts.items())
+        out = {}
+        for name, host in hosts:
+            with host.lock:
+                out[name] = {'queued': host.queued, 'active': host.active,
+                             'requests': host.requests,
+                             'retries': host.retries,
+                             'failures': host.failures,
+                             'wait_total': host.wait_total,
+                             'wait_max': host.wait_max}
+        return out
+
+    def wrap(self, session):
+        """
+        Returns an object that behaves like session, except that its
+        requests go through this scheduler.
+        """
+        return ScheduledSession(self, session)
+
+    def __getstate__(self):
+        # locks can't be pickled, and the statistics are per process
+        state = self.__dict__.copy()
+        state['_hosts'] = {}
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+
+class ScheduledSession(object):
+    """
+    A requests.Session whose requests are sent through a RequestScheduler.
+    Any other attribute, such as cookies, is the wrapped session's.
+    """
+
+    def __init__(self, scheduler, session):
+        self.scheduler = scheduler
+        self.session = session
+
+    def request(self, method, url, **kwargs):
+        return self.scheduler.request(self.session, method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', True)
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, data=None, **kwargs):
+        return self.request('POST', url, data=data, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def __getattr__(self, name):
+        # only called for attributes this object doesn't have; special
+        # methods (e.g. for pickling) must not be taken from the session
+        if name == 'session' or name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self.session, name)
@@ -0,0 +1,187 @@
+import base64
+import json
+import os
+import tempfile
+import threading
+import time
+import zlib
+
+from requests.cookies import create_cookie
+
+from core import TSquareAPI
+
+# bump when the layout of the encoded session changes; sessions written in
+# any other version are treated as missing
+SESSION_VERSION = 1
+_PREFIX = 'tsq{}:'.format(SESSION_VERSION)
+# the keys every encoded session has
+_KEYS = ('u', 'tgt', 'st', 'c')
+
+
+def dump_session(api):
+    """
+    Encodes the state of a logged in TSquareAPI that is needed to use it
+    again without logging in: its CAS tickets and session cookies.
+    @returns A compact, versioned ASCII string.
+    """
+    cookies = [[c.name, c.value, c.domain, c.path, c.secure, c.expires]
+               for c in api._session.cookies]
+    state = {'u': api.username,
+             'tgt': api._tg_ticket,
+             'st': api._service_ticket,
+             'c': cookies,
+             't': int(time.time())}
+    packed = zlib.compress(json.dumps(state, separators=(',', ':')))
+    return _PREFIX + base64.urlsafe_b64encode(packed)
+
+
+def decode_session(data):
+    """
+    Decodes a string produced by dump_session.
+    @throws ValueError - If the string is damaged, is missing part of a
+                         session, or was written by a different version of
+                         this module.
+    """
+    if not data.startswith(_PREFIX):
+        raise ValueError('Unsupported session format')
+    try:
+        state = json.loads(zlib.decompress(base64.urlsafe_b64decode(
+            str(data[len(_PREFIX):]))))
+    except (TypeError, zlib.error):
+        raise ValueError('Damaged session data')
+    if (not isinstance(state, dict) or any(x not in state for x in _KEYS) or
+            not isinstance(state['c'], list)):
+        raise ValueError('Incomplete session data')
+    return state
+
+
+def load_session(data, **kwargs):
+    """
+    Builds a TSquareAPI from a string produced by dump_session without
+    contacting CAS or TSquare. The session isn't checked until it's first
+    used; if it has expired by then, the call raises
+    SessionExpiredException and the object must log in again.
+    Any keyword arguments are passed on to TSquareAPI.
+    @throws ValueError - If data can't be decoded
+    """
+    state = decode_session(data)
+    api = TSquareAPI(state['u'], None, **kwargs)
+    api._tg_ticket = state['tgt']
+    api._service_ticket = state['st']
+    for name, value, domain, path, secure, expires in state['c']:
+        api._session.cookies.set_cookie(create_cookie(name, value,
+                                                      domain=domain, path=path,
+                                                      secure=secure,
+                                                      expires=expires))
+    api._authenticated = True
+    return api
+
+
+class SessionStore(object):
+    """
+    Storage for encoded sessions, keyed by username.
+    """
+
+    def load(self, username):
+        raise NotImplementedError('Subclasses of SessionStore should override this method')
+
+    def save(self, username, data):
+        raise NotImplementedError('Subclasses of SessionStore should override this method')
+
+    def delete(self, username):
+        raise NotImplementedError('Subclasses of SessionStore should override this method')
+
+
+class MemorySessionStore(SessionStore):
+    """
+    Keeps sessions in a dictionary. Useful for tests, or for sharing
+    sessions between the threads of one process.
+    """
+
+    def __init__(self):
+        self._sessions = {}
+        self._lock = threading.Lock()
+
+    def load(self, username):
+        with self._lock:
+            return self._sessions.get(username)
+
+    def save(self, username, data):
+        with self._lock:
+            self._sessions[username] = data
+
+    def delete(self, username):
+        with self._lock:
+            self._sessions.pop(username, None)
+
+
+class FileSessionStore(SessionStore):
+    """
+    Keeps one file per user in a directory, readable only by the owner,
+    so that sessions survive process restarts.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0700)
+
+    def _path(self, username):
+        return os.path.join(self.directory,
+                            base64.urlsafe_b64encode(username.encode('utf-8'))
+                            + '.session')
+
+    def load(self, username):
+        try:
+            with open(self._path(username), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def save(self, username, data):
+        # mkstemp creates the file with mode 0600
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, self._path(username))
+
+    def delete(self, username):
+        try:
+            os.unlink(self._path(username))
+        except OSError:
+            pass
+
+
+def resume(store, username, password_provider, **kwargs):
+    """
+    Returns a TSquareAPI for username, restored from store if it holds a
+    session for that user, or logged in from scratch (and saved to store)
+    otherwise. A restored session is only checked when it is first used;
+    call relogin if that raises SessionExpiredException.
+    @param store (SessionStore) - Where sessions are kept
+    @param username - The user to resume
+    @param password_provider - A function taking the username and returning
+                               the password. Only called when a full login
+                               is needed.
+    Any keyword arguments are passed on to TSquareAPI.
+    """
+    data = store.load(username)
+    if data is not None:
+        try:
+            return load_session(data, **kwargs)
+        except ValueError:
+            store.delete(username)
+    api = TSquareAPI(username, password_provider(username), **kwargs)
+    store.save(username, dump_session(api))
+    return api
+
+
+def relogin(store, api, password_provider):
+    """
+    Logs api in again after its session expired and saves the new session
+    to store.
+    """
+    api.login(password_provider(api.username))
+    api.invalidate_tools()
+    store.save(api.username, dump_session(api))
+    return api
@@ -0,0 +1,272 @@
+from datetime import datetime
+import json
+import sqlite3
+import threading
+import time
+
+from core import (TSquareSite, TSquareAnnouncement, TSquareAssignment,
+                  TSquareUser)
+
+# the kinds of data kept, and the model each is rebuilt as
+KINDS = {'user': TSquareUser,
+         'site': TSquareSite,
+         'announcement': TSquareAnnouncement,
+         'assignment': TSquareAssignment,
+         'grades': None}
+
+# how TSquare writes assignment dates
+_DATE_FORMATS = ('%b %d, %Y %I:%M %p', '%b %d, %Y')
+
+
+def due_time(assignment):
+    """
+    Returns the due date of an assignment dictionary as a Unix time, or
+    None if it has none or it can't be read.
+    """
+    text = (assignment.get('dueDate') or '').strip()
+    for date_format in _DATE_FORMATS:
+        try:
+            return time.mktime(datetime.strptime(text, date_format).timetuple())
+        except ValueError:
+            pass
+    return None
+
+
+class DataStore(object):
+    """
+    Local storage for data fetched from TSquare, keyed by user, kind (see
+    KINDS), site and entity id, along with when each was fetched. A
+    TSquareAPI given a store writes what it fetches to it.
+    """
+
+    def put(self, username, kind, site_id, items, replace=True, fetched=True):
+        """
+        Stores items, a list of (entity id, dictionary) pairs.
+        @param site_id - The site the items belong to, or '' for items that
+                         don't belong to one site.
+        @param replace - If True, items of this kind and site that aren't in
+                         items are removed, since they no longer exist.
+        @param fetched - If True, the time is recorded as when the items of
+                         this kind and site were fetched. Pass False when
+                         items are only some of them, e.g. one site looked
+                         up by id, so that the rest doesn't seem fresh.
+        """
+        raise NotImplementedError('Subclasses of DataStore should override this method')
+
+    def get(self, username, kind, site_id=None):
+        """
+        Returns the stored dictionaries of a kind, of one site or of every
+        site if site_id is None.
+        """
+        raise NotImplementedError('Subclasses of DataStore should override this method')
+
+    def fetched_at(self, username, kind, site_id=''):
+        """
+        Returns the Unix time the items of a kind and site were last stored,
+        or None if they never were.
+        """
+        raise NotImplementedError('Subclasses of DataStore should override this method')
+
+    def assignments_due(self, username, start, end):
+        """
+        Returns the stored assignment dictionaries, across every site, due
+        between the Unix times start and end, soonest first.
+        """
+        raise NotImplementedError('Subclasses of DataStore should override this method')
+
+    def delete(self, username):
+        """
+        Removes everything stored for username.
+        """
+        raise NotImplementedError('Subclasses of DataStore should override this method')
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    site TEXT NOT NULL,
+    id TEXT NOT NULL,
+    due REAL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (user, kind, site, id)
+);
+CREATE INDEX IF NOT EXISTS entities_due ON entities (user, kind, due);
+CREATE TABLE IF NOT EXISTS fetches (
+    user TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    site TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (user, kind, site)
+);
+"""
+
+
+class SQLiteStore(DataStore):
+    """
+    Keeps data in a SQLite database, so that it survives restarts and can
+    be queried without contacting TSquare. One connection is shared by
+    every thread.
+    """
+
+    def __init__(self, path=':memory:'):
+        """
+        @param path - The database file. The default keeps the database in
+                      memory, for the lifetime of the object.
+        """
+        self.path = path
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.executescript(_SCHEMA)
+        self._lock = threading.Lock()
+
+    def put(self, username, kind, site_id, items, replace=True, fetched=True):
+        now = time.time()
+        rows = [(username, kind, site_id, entity_id,
+                 due_time(data) if kind == 'assignment' else None,
+                 json.dumps(data, separators=(',', ':')))
+                for entity_id, data in items]
+        with self._lock:
+            with self._db:
+                if replace:
+                    self._db.execute('DELETE FROM entities WHERE user = ? AND '
+                                     'kind = ? AND site = ?',
+                                     (username, kind, site_id))
+                self._db.executemany('INSERT OR REPLACE INTO entities VALUES '
+                                     '(?, ?, ?, ?, ?, ?)', rows)
+                if fetched:
+                    self._db.execute('INSERT OR REPLACE INTO fetches VALUES '
+                                     '(?, ?, ?, ?)',
+                                     (username, kind, site_id, now))
+
+    def get(self, username, kind, site_id=None):
+        query = 'SELECT data FROM entities WHERE user = ? AND kind = ?'
+        args = [username, kind]
+        if site_id is not None:
+            query += ' AND site = ?'
+            args.append(site_id)
+        with self._lock:
+            rows = self._db.execute(query + ' ORDER BY rowid', args).fetchall()
+        return [json.loads(x[0]) for x in rows]
+
+    def fetched_at(self, username, kind, site_id=''):
+        with self._lock:
+            row = self._db.execute('SELECT fetched_at FROM fetches WHERE '
+                                   'user = ? AND kind = ? AND site = ?',
+                                   (username, kind, site_id)).fetchone()
+        return row[0] if row else None
+
+    def assignments_due(self, username, start, end):
+        with self._lock:
+            rows = self._db.execute('SELECT data FROM entities WHERE user = ? '
+                                    "AND kind = 'assignment' AND due >= ? AND "
+                                    'due < ? ORDER BY due',
+                                    (username, start, end)).fetchall()
+        return [json.loads(x[0]) for x in rows]
+
+    def delete(self, username):
+        with self._lock:
+            with self._db:
+                self._db.execute('DELETE FROM entities WHERE user = ?',
+                                 (username,))
+                self._db.execute('DELETE FROM fetches WHERE user = ?',
+                                 (username,))
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def __getstate__(self):
+        # connections can't be pickled; an in-memory database starts empty
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+
+class StoreReader(object):
+    """
+    Reads a user's data from a DataStore, and from TSquare only when the
+    stored copy is missing or older than max_age. Every method takes a
+    fresh argument: None to decide by max_age, True to always fetch, and
+    False to never fetch (returning [] or None for data never stored).
+    """
+
+    def __init__(self, store, username, api=None, max_age=300):
+        """
+        @param store (DataStore) - Where the data is kept
+        @param username - Whose data to read
+        @param api (TSquareAPI) - Used to fetch missing or stale data. It
+                                  should write through to store. If None,
+                                  only stored data is read.
+        @param max_age - How many seconds stored data is used for before it
+                         is fetched again. None means it never goes stale.
+        """
+        self.store = store
+        self.username = username
+        self.api = api
+        self.max_age = max_age
+
+    def age(self, kind, site_id=''):
+        """
+        Returns how many seconds ago the data of a kind and site was
+        stored, or None if it never was.
+        """
+        fetched_at = self.store.fetched_at(self.username, kind, site_id)
+        return time.time() - fetched_at if fetched_at is not None else None
+
+    def _use_store(self, kind, site_id, fresh):
+        if self.api is None or fresh is False:
+            return True
+        if fresh:
+            return False
+        age = self.age(kind, site_id)
+        return age is not None and (self.max_age is None or age < self.max_age)
+
+    def _read(self, kind, site_id, fetch, fresh):
+        if not self._use_store(kind, site_id, fresh):
+            return fetch()
+        return [KINDS[kind].from_dict(x)
+                for x in self.store.get(self.username, kind, site_id)]
+
+    def get_user_info(self, fresh=None):
+        users = self._read('user', '', lambda: [self.api.get_user_info()], fresh)
+        return users[0] if users else None
+
+    def get_sites(self, fresh=None):
+        return self._read('site', '', self.api and self.api.get_sites, fresh)
+
+    def get_announcements(self, site=None, num=10, age=20, fresh=None):
+        """
+        Returns at most num announcements less than age days old, newest
+        first, as TSquareAPI.get_announcements does.
+        """
+        site_id = site.id if site is not None else None
+        if not self._use_store('announcement', site_id or '', fresh):
+            return self.api.get_announcements(site, num, age)
+        cutoff = (time.time() - age * 24 * 60 * 60) * 1000
+        announcements = [TSquareAnnouncement.from_dict(x) for x in
+                         self.store.get(self.username, 'announcement', site_id)
+                         if x.get('createdOn', 0) >= cutoff]
+        announcements.sort(key=lambda x: getattr(x, 'createdOn', 0),
+                           reverse=True)
+        return announcements[:num]
+
+    def get_assignments(self, site, fresh=None):
+        return self._read('assignment', site.id,
+                          lambda: self.api.get_assignments(site), fresh)
+
+    def get_grades(self, site, fresh=None):
+        if not self._use_store('grades', site.id, fresh):
+            return self.api.get_grades(site)
+        grades = self.store.get(self.username, 'grades', site.id)
+        return grades[0] if grades else None
+
+    def assignments_due(self, days=7, start=None):
+        """
+        Returns the stored assignments of every site due within days days
+        of start (by default, now), soonest first. Never contacts TSquare.
+        """
+        start = time.time() if start is None else start
+        return [TSquareAssignment.from_dict(x) for x in
+                self.store.assignments_due(self.username, start,
+                                           start + days * 24 * 60 * 60)]
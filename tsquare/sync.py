@@ -0,0 +1,239 @@
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def fingerprint(announcement):
+    """
+    Returns a hash of the contents of a TSquareAnnouncement, which changes
+    whenever the announcement is edited.
+    """
+    data = json.dumps(announcement.to_dict(), sort_keys=True)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+class SyncCursor(object):
+    """
+    Where an AnnouncementSync left off in one site (or in every site of a
+    user): the creation time of the newest announcement seen, and the
+    fingerprint and creation time of every announcement seen recently.
+    """
+
+    def __init__(self, latest=None, seen=None, scanned=None):
+        """
+        @param latest - The createdOn of the newest announcement seen, in
+                        milliseconds, or None if nothing was synced yet.
+        @param seen - A dictionary mapping announcement ids to
+                      [fingerprint, createdOn] lists.
+        @param scanned - When the remembered announcements were last
+                         fetched again to look for edits, in milliseconds.
+        """
+        self.latest = latest
+        self.seen = seen if seen is not None else {}
+        self.scanned = scanned
+
+    def to_dict(self):
+        return {'latest': self.latest, 'seen': self.seen,
+                'scanned': self.scanned}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data.get('latest'), data.get('seen'), data.get('scanned'))
+
+
+class CursorStore(object):
+    """
+    Storage for SyncCursor objects, keyed by strings.
+    """
+
+    def load(self, key):
+        raise NotImplementedError('Subclasses of CursorStore should override this method')
+
+    def save(self, key, cursor):
+        raise NotImplementedError('Subclasses of CursorStore should override this method')
+
+    def delete(self, key):
+        raise NotImplementedError('Subclasses of CursorStore should override this method')
+
+
+class MemoryCursorStore(CursorStore):
+    """
+    Keeps cursors in a dictionary, for the lifetime of the process.
+    """
+
+    def __init__(self):
+        self._cursors = {}
+        self._lock = threading.Lock()
+
+    def load(self, key):
+        with self._lock:
+            data = self._cursors.get(key)
+        return SyncCursor.from_dict(data) if data is not None else None
+
+    def save(self, key, cursor):
+        data = json.loads(json.dumps(cursor.to_dict()))
+        with self._lock:
+            self._cursors[key] = data
+
+    def delete(self, key):
+        with self._lock:
+            self._cursors.pop(key, None)
+
+
+class FileCursorStore(CursorStore):
+    """
+    Keeps one JSON file per cursor in a directory, so that polling stays
+    incremental across process restarts.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def _path(self, key):
+        return os.path.join(self.directory,
+                            base64.urlsafe_b64encode(key.encode('utf-8'))
+                            + '.json')
+
+    def load(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                return SyncCursor.from_dict(json.load(f))
+        except (IOError, ValueError):
+            return None
+
+    def save(self, key, cursor):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            json.dump(cursor.to_dict(), f, separators=(',', ':'))
+        os.rename(tmp_path, self._path(key))
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
+
+
+class AnnouncementSync(object):
+    """
+    Polls the announcements of a TSquareAPI incrementally. Each call to
+    sync asks TSquare only for the days since the newest announcement it
+    saw (plus SLACK_DAYS), and returns just the announcements that are new
+    or were edited since.
+    """
+    # extra days each sync looks back, so that announcements posted around
+    # the newest one seen aren't missed
+    SLACK_DAYS = 1
+
+    def __init__(self, api, store=None, num=10, age=20, max_num=640,
+                 retention=None, edit_scan_interval=None):
+        """
+        Initialize an AnnouncementSync.
+        @param api (TSquareAPI) - The logged in user to poll as
+        @param store (CursorStore) - Where cursors are kept. Defaults to a
+                                     MemoryCursorStore.
+        @param num - How many announcements to ask for at first. Doubled,
+                     up to max_num, while a response is full of unseen
+                     announcements, since more may have been cut off.
+        @param age - How many days back the first sync looks.
+        @param max_num - The most announcements asked for in one request.
+        @param retention - How many days before the newest announcement seen
+                           announcements are remembered. Defaults to age.
+        @param edit_scan_interval - If not None, a sync made at least this
+                                    many seconds after the last such scan
+                                    looks back over every remembered
+                                    announcement, so that edits to them are
+                                    noticed. Otherwise only edits within
+                                    the days a sync asks for are noticed.
+        """
+        self.api = api
+        self.store = store if store is not None else MemoryCursorStore()
+        self.num = num
+        self.age = age
+        self.max_num = max_num
+        self.retention = retention if retention is not None else age
+        self.edit_scan_interval = edit_scan_interval
+
+    def _key(self, site):
+        return '{}/{}'.format(self.api.username, site.id if site else '')
+
+    def cursor(self, site=None):
+        """
+        Returns the stored cursor of site (or of every site, if site is
+        None), or None if it was never synced.
+        """
+        return self.store.load(self._key(site))
+
+    def reset(self, site=None):
+        """
+        Forgets the cursor of site, so that the next sync starts over.
+        """
+        self.store.delete(self._key(site))
+
+    def sync(self, site=None):
+        """
+        Returns the announcements of site (or of every site, if site is
+        None) that were posted or edited since the last sync, newest first.
+        The first sync returns every announcement less than age days old.
+        """
+        key = self._key(site)
+        cursor = self.store.load(key) or SyncCursor()
+        now = int(time.time() * 1000)
+        if cursor.latest is None:
+            age = self.age
+        elif self._scan_due(cursor, now):
+            # look back far enough to cover the announcements we remember,
+            # so edits to them are noticed too
+            oldest = cursor.latest - self.retention * DAY_MS
+            age = max(1, -(-(now - oldest) // DAY_MS)) + self.SLACK_DAYS
+            cursor.scanned = now
+        else:
+            age = max(1, -(-(now - cursor.latest) // DAY_MS)) + self.SLACK_DAYS
+        if cursor.scanned is None:
+            cursor.scanned = now
+        num = self.num
+        while True:
+            announcements = self.api.get_announcements(site, num, age)
+            if (len(announcements) < num or num >= self.max_num or
+                    self._overlaps(cursor, announcements)):
+                break
+            # the response is full and everything in it is new, so older
+            # announcements we haven't seen may have been cut off
+            num = min(num * 2, self.max_num)
+        changed = []
+        for announcement in announcements:
+            digest = fingerprint(announcement)
+            entry = cursor.seen.get(announcement.id)
+            if entry is None or entry[0] != digest:
+                changed.append(announcement)
+            cursor.seen[announcement.id] = [digest, announcement.createdOn]
+            if cursor.latest is None or announcement.createdOn > cursor.latest:
+                cursor.latest = announcement.createdOn
+        if cursor.latest is not None:
+            cutoff = cursor.latest - self.retention * DAY_MS
+            for id, (digest, created) in cursor.seen.items():
+                if created < cutoff:
+                    del cursor.seen[id]
+        self.store.save(key, cursor)
+        return changed
+
+    def _scan_due(self, cursor, now):
+        if self.edit_scan_interval is None:
+            return False
+        return (cursor.scanned is None or
+                now - cursor.scanned >= self.edit_scan_interval * 1000)
+
+    def _overlaps(self, cursor, announcements):
+        # True if the response reaches back to announcements synced before
+        if cursor.latest is None:
+            return True
+        return any(x.id in cursor.seen or x.createdOn <= cursor.latest
+                   for x in announcements)
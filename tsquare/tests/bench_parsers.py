@@ -0,0 +1,76 @@
+"""
+Measures the per-page cost of the DefaultParser scrapers, comparing a
+fresh HTMLParser per page (how DefaultParser used to work) against the
+reused, purged per-thread parsers, the cost of the full BeautifulSoup
+scraper against the strained one, and the BeautifulSoup gradebook
+scraper against the single-pass gradebook parser.
+
+    python tsquare/tests/bench_parsers.py [number]
+"""
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import timeit
+from tsquare import parsers
+from tsquare.tests import fixtures
+
+CASES = [('get_iframes', parsers._IFrameParser, 'assignments_tool.html'),
+         ('get_tools', parsers._SiteToolHTMLParser, 'portal.html'),
+         ('get_assignments', parsers._AssignmentHTMLParser, 'assignments.html')]
+
+SOUP_CASES = [('get_iframes', 'assignments_tool.html'),
+              ('get_tools', 'portal.html'),
+              ('get_assignments', 'assignments.html'),
+              ('get_grades', 'gradebook.html'),
+              ('get_syllabus', 'syllabus.html')]
+
+
+def best_time(func, number, repeat=5):
+    """
+    Returns the best per-call time of func, in seconds.
+    """
+    return min(timeit.repeat(func, number=number, repeat=repeat)) / number
+
+
+def main(number=2000):
+    reused = parsers.DefaultParser()
+    print '{:<18}{:>14}{:>14}{:>10}'.format('method', 'fresh (us)',
+                                           'reused (us)', 'speedup')
+    for method, parser_class, fixture in CASES:
+        html = fixtures.load(fixture)
+        fresh = best_time(lambda: getattr(parser_class(), method)(html), number)
+        pooled = best_time(lambda: getattr(reused, method)(html), number)
+        print '{:<18}{:>14.1f}{:>14.1f}{:>9.2f}x'.format(method, fresh * 1e6,
+                                                        pooled * 1e6,
+                                                        fresh / pooled)
+    if not parsers.BS_AVAILABLE:
+        return
+    full, strained = parsers.LXMLParser(), parsers.StrainedParser()
+    print
+    print '{:<18}{:>14}{:>14}{:>10}'.format('method', 'bs4 (us)',
+                                           'strained (us)', 'speedup')
+    for method, fixture in SOUP_CASES:
+        html = fixtures.load(fixture)
+        before = best_time(lambda: getattr(full, method)(html), number // 4)
+        after = best_time(lambda: getattr(strained, method)(html), number // 4)
+        print '{:<18}{:>14.1f}{:>14.1f}{:>9.2f}x'.format(method, before * 1e6,
+                                                        after * 1e6,
+                                                        before / after)
+    default = parsers.DefaultParser()
+    print
+    print '{:<18}{:>14}{:>14}{:>10}'.format('gradebook rows', 'bs4 (us)',
+                                           'one pass (us)', 'speedup')
+    for scale in (1, 10, 50):
+        html = fixtures.load('gradebook.html', scale=scale).decode('utf-8')
+        runs = max(1, number // (20 * scale))
+        before = best_time(lambda: full.get_grades(html), runs)
+        after = best_time(lambda: default.get_grade_records(html), runs)
+        print '{:<18}{:>14.1f}{:>14.1f}{:>9.2f}x'.format(3 * scale, before * 1e6,
+                                                        after * 1e6,
+                                                        before / after)
+
+
+if __name__ == "__main__":
+    main(*[int(x) for x in sys.argv[1:2]])
@@ -0,0 +1,157 @@
+"""
+Offline benchmarks. Every public TSquareAPI method is timed end to end,
+with its caches and without, against a local stand-in server that
+replays the recorded fixtures, and every scraper in
+parsers.REGISTERED_METHODS and every JSON decoder in
+decoders.REGISTERED_DECODERS is timed on its own, on both the recorded
+(small) pages and large pages built by repeating their rows.
+Results are written as JSON so that runs can be compared for regressions.
+
+    python tsquare/tests/benchmarks.py [--number N] [--output results.json]
+"""
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import argparse
+import json
+import platform
+import time
+
+from tsquare import decoders, parsers
+from tsquare.core import TSquareAPI, TSquareSite, TSquareAnnouncement
+from tsquare.tests import fixtures
+from tsquare.tests.stub_server import StubTSquare
+
+SIZES = [('small', 1), ('large', 50)]
+
+API_METHODS = ['get_sites', 'get_announcements', 'get_tools',
+               'get_assignments', 'get_grades', 'get_grade_records',
+               'get_syllabus']
+
+PARSER_CASES = [('get_iframes', 'assignments_tool.html'),
+                ('get_tools', 'portal.html'),
+                ('get_assignments', 'assignments.html'),
+                ('get_grades', 'gradebook.html'),
+                ('get_grade_records', 'gradebook.html'),
+                ('get_syllabus', 'syllabus.html')]
+
+
+def measure(func, number):
+    """
+    Calls func number times and returns statistics of the call times, in
+    milliseconds.
+    """
+    func() # warm up
+    times = []
+    for i in range(number):
+        start = time.time()
+        func()
+        times.append((time.time() - start) * 1000)
+    times.sort()
+    return {'number': number,
+            'min_ms': times[0],
+            'median_ms': times[len(times) // 2],
+            'mean_ms': sum(times) / len(times),
+            'p95_ms': times[min(len(times) - 1, int(len(times) * 0.95))],
+            'max_ms': times[-1]}
+
+
+def bench_api(number, scraper='bs4'):
+    """
+    Times each API method against the stand-in server, both uncached and
+    with the default caches. Uncached, the tool, frame and page caches are
+    disabled or emptied before every call, so that every call pays for
+    the whole chain of requests and scraping.
+    """
+    results = []
+    for size, scale in SIZES:
+        with StubTSquare(scale=scale):
+            for cached in (False, True):
+                if cached:
+                    api = TSquareAPI('gburdell3', 'password', scraper=scraper)
+                else:
+                    api = TSquareAPI('gburdell3', 'password', scraper=scraper,
+                                     tool_cache_ttl=0, page_cache_size=0)
+                site = api.get_sites()[0]
+                for method in API_METHODS:
+                    args = () if method == 'get_sites' else (site,)
+                    if cached:
+                        call = lambda: getattr(api, method)(*args)
+                    else:
+                        call = lambda: (api.invalidate_tools(),
+                                        getattr(api, method)(*args))
+                    result = {'group': 'api', 'name': method, 'size': size,
+                              'scraper': scraper, 'cached': cached}
+                    result.update(measure(call, number))
+                    results.append(result)
+    return results
+
+
+def bench_parsers(number):
+    """
+    Times each registered scraper on each page it can scrape.
+    """
+    results = []
+    for scraper in sorted(parsers.REGISTERED_METHODS):
+        parser = parsers.REGISTERED_METHODS[scraper]()
+        for size, scale in SIZES:
+            for method, fixture in PARSER_CASES:
+                html = fixtures.load(fixture, scale=scale)
+                result = {'group': 'parser', 'name': method, 'size': size,
+                          'scraper': scraper, 'bytes': len(html)}
+                try:
+                    getattr(parser, method)(html)
+                except (NotImplementedError, AttributeError):
+                    result['unsupported'] = True
+                else:
+                    call = lambda: getattr(parser, method)(html)
+                    result.update(measure(call, number))
+                results.append(result)
+    return results
+
+
+def bench_decoders(number):
+    """
+    Times decoding the JSON pages and building their models with each
+    installed decoder.
+    """
+    results = []
+    for name in sorted(decoders.REGISTERED_DECODERS):
+        decode = decoders.REGISTERED_DECODERS[name]
+        for size, scale in SIZES:
+            for fixture, key, model in [('site.json', 'site_collection', TSquareSite),
+                                        ('announcements.json',
+                                         'announcement_collection',
+                                         TSquareAnnouncement)]:
+                body = fixtures.load(fixture, scale=scale)
+                call = lambda: [model.from_dict(x) for x in decode(body)[key]]
+                result = {'group': 'decoder', 'name': fixture, 'size': size,
+                          'scraper': name, 'bytes': len(body)}
+                result.update(measure(call, number))
+                results.append(result)
+    return results
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    arg_parser.add_argument('--number', type=int, default=20,
+                            help='calls timed per benchmark')
+    arg_parser.add_argument('--output', help='file to write results to '
+                                             '(default: stdout)')
+    args = arg_parser.parse_args(argv)
+    report = {'python': platform.python_version(),
+              'time': time.time(),
+              'results': (bench_api(args.number) + bench_parsers(args.number) +
+                          bench_decoders(args.number))}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        print
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+"""
+Recorded TSquare pages used by the offline tests and the benchmarks.
+Absolute URLs in the pages are written as {base} so they can be pointed
+at a local stand-in server. The rows between <!-- repeat --> and
+<!-- /repeat --> in a page, or the items of a JSON collection, can be
+repeated to build large versions of a page.
+"""
+from os.path import abspath, dirname, join
+import json
+import re
+
+FIXTURE_DIR = abspath(dirname(__file__))
+DEFAULT_BASE = 'https://t-square.gatech.edu'
+
+_REPEAT = re.compile(r'<!-- repeat -->(.*?)<!-- /repeat -->', re.DOTALL)
+
+
+def load(name, base=DEFAULT_BASE, scale=1):
+    """
+    Returns the contents of the fixture file name with {base} replaced.
+    @param scale - How many times the repeatable part of the fixture is
+                   repeated.
+    """
+    with open(join(FIXTURE_DIR, name), 'rb') as f:
+        text = f.read().replace('{base}', base)
+    if scale == 1:
+        return text
+    if name.endswith('.json'):
+        return _scale_json(text, scale)
+    return _REPEAT.sub(lambda m: m.group(1) * scale, text)
+
+
+def _scale_json(text, scale):
+    data = json.loads(text)
+    for key in data:
+        if key.endswith('_collection'):
+            items = data[key]
+            data[key] = []
+            for i in range(scale):
+                for item in items:
+                    item = dict(item)
+                    item['id'] = item['entityId'] = '{}-{}'.format(item['id'], i)
+                    data[key].append(item)
+    return json.dumps(data)
@@ -0,0 +1,291 @@
+"""
+A local stand-in for login.gatech.edu and t-square.gatech.edu that
+replays the recorded fixtures, so that TSquareAPI can be exercised end
+to end without credentials or network access.
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+from urlparse import urlparse, parse_qs
+import hashlib
+import itertools
+import json
+import re
+import socket
+import threading
+
+from tsquare import core
+from tsquare.tests import fixtures
+
+BAD_USERNAME = 'BAD_USERNAME'
+
+_PAGES = [(r'/direct/+site\.json$', 'site.json'),
+          (r'/direct/+user/current\.json$', 'user.json'),
+          (r'/direct/+announcement/(site/[^/]+|user)\.json$', 'announcements.json'),
+          (r'/portal/site/[^/]+$', 'portal.html'),
+          (r'/portal/site/[^/]+/page/[^/]+-asn$', 'assignments_tool.html'),
+          (r'/portal/site/[^/]+/page/[^/]+-gb$', 'gradebook_tool.html'),
+          (r'/portal/site/[^/]+/page/[^/]+-syl$', 'syllabus_tool.html'),
+          (r'/portal/tool/asn\d+$', 'assignments.html'),
+          (r'/portal/tool/gb\d+$', 'gradebook.html'),
+          (r'/portal/tool/syl\d+$', 'syllabus.html')]
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, *args):
+        HTTPServer.__init__(self, *args)
+        # the open keep-alive connections, by the thread serving each
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        thread = threading.Thread(target=self._serve,
+                                  args=(request, client_address))
+        thread.daemon = True
+        with self._lock:
+            self._connections[thread] = request
+        thread.start()
+
+    def _serve(self, request, client_address):
+        try:
+            self.process_request_thread(request, client_address)
+        finally:
+            with self._lock:
+                self._connections.pop(threading.current_thread(), None)
+
+    def close_connections(self):
+        """
+        Closes every open connection and waits for the threads serving
+        them, so that none is left running when the interpreter exits.
+        """
+        with self._lock:
+            connections = list(self._connections.items())
+        for thread, request in connections:
+            try:
+                request.shutdown(socket.SHUT_RDWR)
+            except socket.error:
+                pass
+        for thread, request in connections:
+            thread.join()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # send each response in one write, so that timings aren't skewed by
+    # delayed ACKs on a half-written response
+    wbufsize = -1
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body='', headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _form(self):
+        length = int(self.headers.getheader('Content-Length') or 0)
+        return dict((k, v[0]) for k, v in parse_qs(self.rfile.read(length)).items())
+
+    def do_POST(self):
+        stub = self.server.stub
+        path = urlparse(self.path).path
+        stub.log(self.command, path)
+        form = self._form()
+        if stub.failing(path):
+            return self._send(503)
+        if path == '/cas/rest/tickets':
+            if form.get('username') == BAD_USERNAME or not form.get('password'):
+                return self._send(400)
+            ticket = stub.new_ticket('TGT')
+            stub.granting_tickets.add(ticket)
+            return self._send(201, '<html><body><form action="{}/cas/rest/tickets/{}" '
+                                   'method="POST"></form></body></html>'
+                                   .format(stub.base, ticket))
+        match = re.match(r'/cas/rest/tickets/(TGT-[^/]+)$', path)
+        if match:
+            if match.group(1) not in stub.granting_tickets:
+                return self._send(404)
+            if 'service' not in form:
+                return self._send(400)
+            return self._send(200, stub.new_ticket('ST'))
+        self._send(404)
+
+    def do_DELETE(self):
+        stub = self.server.stub
+        path = urlparse(self.path).path
+        stub.log(self.command, path)
+        stub.granting_tickets.discard(path.rsplit('/', 1)[-1])
+        self._send(200)
+
+    def do_GET(self):
+        stub = self.server.stub
+        url = urlparse(self.path)
+        stub.log(self.command, url.path)
+        if stub.failing(url.path):
+            return self._send(503)
+        if url.path == '/sakai-login-tool/container':
+            session_id = stub.new_ticket('session')
+            stub.sessions.add(session_id)
+            return self._send(200, '', {'Set-Cookie': 'JSESSIONID={}; Path=/'
+                                                      .format(session_id)})
+        if url.path == '/portal/xlogin':
+            return self._send(200, '<html><body><form action="/portal/xlogin" '
+                                   'method="POST"></form></body></html>',
+                              {'Content-Type': 'text/html; charset=UTF-8'})
+        if url.path in stub.forbidden:
+            return self._send(403)
+        match = re.match(r'/direct/+site/([^/]+)\.json$', url.path)
+        if match:
+            for site in json.loads(stub.page('site.json'))['site_collection']:
+                if site['id'] == match.group(1):
+                    return self._send(200, json.dumps(site),
+                                      {'Content-Type': 'application/json'})
+            return self._send(404)
+        if url.path in stub.gone:
+            return self._send(404)
+        if url.path in stub.moved:
+            return self._send(302, '', {'Location': stub.base + stub.moved[url.path]})
+        for pattern, name in _PAGES:
+            if re.match(pattern, url.path):
+                break
+        else:
+            return self._send(404)
+        cookie = self.headers.getheader('Cookie') or ''
+        match = re.search(r'JSESSIONID=([^;]+)', cookie)
+        if not (match and match.group(1) in stub.sessions):
+            if name == 'site.json':
+                # an expired session sees no sites
+                return self._send(200, '{"entityPrefix": "site", "site_collection": []}',
+                                  {'Content-Type': 'application/json'})
+            # and is sent to the login page
+            return self._send(302, '', {'Location': stub.base + '/portal/xlogin'})
+        body = stub.page(name)
+        query = parse_qs(url.query)
+        if name.endswith('.json') and set(query) & set(['n', '_start', '_limit']):
+            data = json.loads(body)
+            for key in data:
+                if key.endswith('_collection'):
+                    items = data[key]
+                    if name == 'announcements.json' and 'n' in query:
+                        items = items[:int(query['n'][0])]
+                    start = int(query.get('_start', [0])[0])
+                    limit = int(query.get('_limit', [len(items)])[0])
+                    data[key] = items[start:start + limit]
+            body = json.dumps(data)
+        if name.endswith('.json'):
+            etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+            if self.headers.getheader('If-None-Match') == etag:
+                return self._send(304, '', {'ETag': etag})
+            return self._send(200, body, {'Content-Type': 'application/json',
+                                          'ETag': etag})
+        self._send(200, body, {'Content-Type': 'text/html; charset=UTF-8'})
+
+
+class StubTSquare(object):
+    """
+    Serves the fixtures on a random local port. Used as a context manager,
+    it also points tsquare.core at itself for the duration of the block.
+    """
+
+    def __init__(self, scale=1):
+        """
+        @param scale - How many times the repeatable part of each fixture is
+                       repeated; see fixtures.load.
+        """
+        self.scale = scale
+        self.requests = []
+        self.granting_tickets = set()
+        self.sessions = set()
+        # paths that answer with a 404 or a 403, and paths that redirect
+        # elsewhere
+        self.gone = set()
+        self.forbidden = set()
+        self.moved = {}
+        self._failures = {}
+        self._pages = {}
+        self._counter = itertools.count(1)
+        self._server = None
+        self._saved = None
+
+    @property
+    def base(self):
+        return 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def page(self, name):
+        if name not in self._pages:
+            self._pages[name] = fixtures.load(name, self.base, self.scale)
+        return self._pages[name]
+
+    def set_page(self, name, body):
+        """
+        Serves body in place of the fixture name from now on.
+        """
+        self._pages[name] = body
+
+    def new_ticket(self, prefix):
+        return '{}-{}-stub'.format(prefix, next(self._counter))
+
+    def log(self, method, path):
+        self.requests.append((method, path))
+
+    def expire_sessions(self):
+        """
+        Makes TSquare forget every session, as if they had timed out.
+        """
+        self.sessions.clear()
+
+    def fail(self, path, times):
+        """
+        Makes the next times requests for path answer with a 503.
+        """
+        self._failures[path] = times
+
+    def failing(self, path):
+        remaining = self._failures.get(path, 0)
+        if remaining:
+            self._failures[path] = remaining - 1
+        return remaining > 0
+
+    def revoke_tickets(self):
+        """
+        Makes CAS forget every ticket-granting ticket.
+        """
+        self.granting_tickets.clear()
+
+    def start(self):
+        self._server = _ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self._server.stub = self
+        thread = threading.Thread(target=self._server.serve_forever,
+                                  args=(0.01,))
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._server.close_connections()
+
+    def patch(self):
+        self._saved = (core.BASE_URL_GATECH, core.SERVICE, core.BASE_URL_TSQUARE)
+        core.BASE_URL_GATECH = self.base + '/cas/'
+        core.SERVICE = self.base + '/sakai-login-tool/container'
+        core.BASE_URL_TSQUARE = self.base + '/direct/'
+
+    def unpatch(self):
+        core.BASE_URL_GATECH, core.SERVICE, core.BASE_URL_TSQUARE = self._saved
+
+    def __enter__(self):
+        self.start()
+        self.patch()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.unpatch()
+        self.stop()
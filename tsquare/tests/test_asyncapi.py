@@ -0,0 +1,74 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import os
+import unittest
+from multiprocessing.pool import ThreadPool
+from tsquare import asyncapi
+from tsquare.core import *
+
+try:
+    TSQUARE_LOGIN = os.environ['TSQUARE_LOGIN']
+    TSQUARE_PASS = os.environ['TSQUARE_PASS']
+except KeyError:
+    TSQUARE_LOGIN = ''
+    TSQUARE_PASS = ''
+
+
+class _FakeAPI(object):
+    def __init__(self, username, password, **kwargs):
+        if password == 'BAD_PASSWORD':
+            raise TSquareAuthException('Username or password incorrect')
+        self.username = username
+
+    def get_sites(self, filter_func=lambda x: True):
+        return [x for x in ['site1', 'site2'] if filter_func(x)]
+
+
+class AsyncTSquareAPIOfflineTests(unittest.TestCase):
+
+    def setUp(self):
+        self._real_api = asyncapi.TSquareAPI
+        asyncapi.TSquareAPI = _FakeAPI
+        self.pool = ThreadPool(2)
+
+    def tearDown(self):
+        asyncapi.TSquareAPI = self._real_api
+        self.pool.close()
+        self.pool.join()
+
+    def test_calls_wait_for_login(self):
+        api = asyncapi.AsyncTSquareAPI('user', 'pass', pool=self.pool)
+        result = api.get_sites(filter_func=lambda x: x == 'site2')
+        self.assertEqual(result.get(5), ['site2'])
+        self.assertTrue(api.ready())
+
+    def test_callback(self):
+        seen = []
+        api = asyncapi.AsyncTSquareAPI('user', 'pass', pool=self.pool)
+        api.get_sites(callback=seen.append).wait(5)
+        self.assertEqual(seen, [['site1', 'site2']])
+
+    def test_bad_login_raises_on_get(self):
+        api = asyncapi.AsyncTSquareAPI('user', 'BAD_PASSWORD', pool=self.pool)
+        with self.assertRaises(TSquareAuthException):
+            api.get_sites().get(5)
+
+
+class AsyncTSquareAPITests(unittest.TestCase):
+
+    def setUp(self):
+        if TSQUARE_LOGIN == '' or TSQUARE_PASS == '':
+            self.skipTest('Username or password not supplied.')
+
+    def test_user_info(self):
+        api = asyncapi.AsyncTSquareAPI(TSQUARE_LOGIN, TSQUARE_PASS)
+        user = api.get_user_info().get()
+        self.assertIsInstance(user, TSquareUser)
+        self.assertEqual(user.displayId, TSQUARE_LOGIN)
+
+
+if __name__ == "__main__":
+    unittest.main()
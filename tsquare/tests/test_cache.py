@@ -0,0 +1,66 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import pickle
+import time
+import unittest
+from tsquare.cache import TTLCache
+
+
+class TTLCacheTests(unittest.TestCase):
+
+    def test_get_set(self):
+        cache = TTLCache(ttl=60, max_size=10)
+        self.assertIsNone(cache.get('site'))
+        cache.set('site', ['tool'])
+        self.assertEqual(cache.get('site'), ['tool'])
+        self.assertIn('site', cache)
+
+    def test_expiry(self):
+        cache = TTLCache(ttl=0.01, max_size=10)
+        cache.set('site', ['tool'])
+        time.sleep(0.02)
+        self.assertIsNone(cache.get('site'))
+        self.assertNotIn('site', cache)
+
+    def test_zero_ttl_disables_cache(self):
+        cache = TTLCache(ttl=0, max_size=10)
+        cache.set('site', ['tool'])
+        self.assertIsNone(cache.get('site'))
+
+    def test_lru_eviction(self):
+        cache = TTLCache(ttl=None, max_size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(len(cache), 2)
+
+    def test_invalidate(self):
+        cache = TTLCache()
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.invalidate('a')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 2)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_pickle(self):
+        cache = TTLCache(ttl=30, max_size=5)
+        cache.set('a', 1)
+        cache = pickle.loads(pickle.dumps(cache))
+        self.assertEqual(cache.ttl, 30)
+        self.assertEqual(cache.max_size, 5)
+        self.assertIsNone(cache.get('a'))
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
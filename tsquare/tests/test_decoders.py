@@ -0,0 +1,58 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import json
+import unittest
+from tsquare import decoders
+from tsquare.core import *
+from tsquare.tests.stub_server import StubTSquare
+
+
+class DecoderTests(unittest.TestCase):
+    def test_default(self):
+        self.assertIs(decoders.get_decoder(), json.loads)
+        self.assertIs(decoders.get_decoder('json'), json.loads)
+
+    def test_auto(self):
+        decode = decoders.get_decoder('auto')
+        self.assertIn(decode, [decoders.get_decoder(x)
+                               for x in decoders.REGISTERED_DECODERS])
+        self.assertEqual(decode('{"a": [1, "b"]}'), {'a': [1, 'b']})
+
+    def test_lazy_decoder(self):
+        decoder = decoders._LazyDecoder('json')
+        self.assertEqual(decoder('[1]'), [1])
+        self.assertIs(decoder.load(), json.loads)
+
+    def test_callable(self):
+        decode = lambda body: {}
+        self.assertIs(decoders.get_decoder(decode), decode)
+
+    def test_missing(self):
+        with self.assertRaises(ValueError):
+            decoders.get_decoder('no-such-decoder')
+
+    def test_api_decoder(self):
+        bodies = []
+        def decode(body):
+            bodies.append(body)
+            return json.loads(body)
+        with StubTSquare():
+            api = TSquareAPI('gburdell3', 'password', json_decoder=decode)
+            sites = api.get_sites()
+        self.assertEqual([x.id for x in sites], ['gtc-cs2110-a', 'gtc-math2401-b'])
+        # the decoder is handed the raw bytes
+        self.assertIsInstance(bodies[0], str)
+
+    def test_same_models(self):
+        with StubTSquare():
+            api = TSquareAPI('gburdell3', 'password', json_decoder='auto')
+            first = [x.to_dict() for x in api.get_sites()]
+            api = TSquareAPI('gburdell3', 'password')
+            self.assertEqual(first, [x.to_dict() for x in api.get_sites()])
+
+
+if __name__ == "__main__":
+    unittest.main()
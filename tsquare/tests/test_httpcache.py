@@ -0,0 +1,97 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import shutil
+import tempfile
+import unittest
+import requests
+from tsquare.httpcache import *
+
+
+class _FakeResponse(object):
+    def __init__(self, status_code, text='', headers=None):
+        self.status_code = status_code
+        self.content = text
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(self.status_code)
+
+
+class _FakeSession(object):
+    """
+    Serves one JSON body with an ETag and honors If-None-Match.
+    """
+    def __init__(self, text, etag='"v1"'):
+        self.text = text
+        self.etag = etag
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append(headers or {})
+        if headers and headers.get('If-None-Match') == self.etag:
+            return _FakeResponse(304)
+        return _FakeResponse(200, self.text, {'ETag': self.etag})
+
+
+class HTTPCacheTests(unittest.TestCase):
+
+    def _check_revalidation(self, cache):
+        session = _FakeSession('{"site_collection": []}')
+        self.assertEqual(cache.get(session, 'http://x/site.json'),
+                         '{"site_collection": []}')
+        self.assertEqual(cache.get(session, 'http://x/site.json'),
+                         '{"site_collection": []}')
+        self.assertEqual(session.requests[1], {'If-None-Match': '"v1"'})
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        # a changed resource replaces the stored copy
+        session.text, session.etag = '{"site_collection": [1]}', '"v2"'
+        self.assertEqual(cache.get(session, 'http://x/site.json'),
+                         '{"site_collection": [1]}')
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+
+    def test_memory_backend(self):
+        self._check_revalidation(HTTPCache(MemoryCacheBackend(max_entries=4)))
+
+    def test_file_backend(self):
+        directory = tempfile.mkdtemp()
+        try:
+            self._check_revalidation(HTTPCache(FileCacheBackend(directory)))
+            # entries survive a new cache object over the same directory
+            cache = HTTPCache(FileCacheBackend(directory))
+            session = _FakeSession('{"site_collection": [1]}', '"v2"')
+            cache.get(session, 'http://x/site.json')
+            self.assertEqual(cache.hits, 1)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_body_kept_as_bytes(self):
+        directory = tempfile.mkdtemp()
+        try:
+            body = u'{"title": "caf\xe9"}'.encode('utf-8')
+            for backend in [MemoryCacheBackend(), FileCacheBackend(directory)]:
+                cache = HTTPCache(backend)
+                session = _FakeSession(body)
+                cache.get(session, 'http://x/site.json')
+                content = cache.get(session, 'http://x/site.json')
+                self.assertEqual(cache.hits, 1)
+                self.assertIsInstance(content, bytes)
+                self.assertEqual(content, body)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_error_not_cached(self):
+        class _ErrorSession(object):
+            def get(self, url, headers=None):
+                return _FakeResponse(500)
+        cache = HTTPCache()
+        with self.assertRaises(requests.HTTPError):
+            cache.get(_ErrorSession(), 'http://x/site.json')
+        self.assertIsNone(cache.backend.get('http://x/site.json'))
+
+
+if __name__ == "__main__":
+    unittest.main()
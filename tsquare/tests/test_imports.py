@@ -0,0 +1,89 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import json
+import subprocess
+import unittest
+from tsquare import parsers
+
+ROOT = abspath(join(abspath(dirname(__file__)), "..", ".."))
+
+# the most time importing tsquare.core may take on top of importing
+# requests, in seconds
+IMPORT_BUDGET = 0.1
+
+# modules that only some features need, and that must not be imported
+# until those features are used
+LAZY_MODULES = ['BeautifulSoup', 'multiprocessing.pool', 'pkg_resources',
+                'simplejson', 'ujson']
+
+_MEASURE = """
+import json, sys, time
+sys.path.insert(0, {root!r})
+import requests
+start = time.time()
+import tsquare.core
+print json.dumps({{'seconds': time.time() - start,
+                  'loaded': [m for m in {lazy!r} if m in sys.modules]}})
+"""
+
+
+def measure_import():
+    """
+    Imports tsquare.core in a fresh interpreter and returns the time it
+    took and which of LAZY_MODULES it imported.
+    """
+    code = _MEASURE.format(root=ROOT, lazy=LAZY_MODULES)
+    output = subprocess.check_output([sys.executable, '-c', code])
+    return json.loads(output)
+
+
+class ImportTests(unittest.TestCase):
+    def test_lazy_modules(self):
+        self.assertEqual(measure_import()['loaded'], [])
+
+    def test_import_budget(self):
+        # best of a few runs, so that a busy machine doesn't fail the test
+        seconds = min(measure_import()['seconds'] for i in range(3))
+        self.assertLess(seconds, IMPORT_BUDGET)
+
+
+class ParserRegistryTests(unittest.TestCase):
+    def test_lazy_backend(self):
+        registry = parsers.ParserRegistry()
+        registry.register('default', 'tsquare.parsers:DefaultParser')
+        self.assertIs(registry['default'], parsers.DefaultParser)
+
+    def test_missing_backend(self):
+        registry = parsers.ParserRegistry(group='tsquare.tests.no-such-group')
+        with self.assertRaises(KeyError):
+            registry['missing']
+        self.assertNotIn('missing', registry)
+
+    def test_entry_points(self):
+        class _EntryPoint(object):
+            name = 'plugin'
+            def load(self):
+                return parsers.DefaultParser
+        registry = parsers.ParserRegistry()
+        registry._plugins_loaded = True
+        registry.register('plugin', _EntryPoint())
+        self.assertEqual(registry.keys(), ['plugin'])
+        self.assertIs(registry['plugin'], parsers.DefaultParser)
+
+    def test_dict_access(self):
+        registry = parsers.ParserRegistry(group='tsquare.tests.no-such-group')
+        registry['default'] = 'tsquare.parsers:DefaultParser'
+        self.assertIs(registry.get('default'), parsers.DefaultParser)
+        self.assertEqual(registry.get('missing'), None)
+        self.assertEqual(registry.items(), [('default', parsers.DefaultParser)])
+
+    def test_builtin_backends(self):
+        for name in ['bs4', 'default', 'strained']:
+            self.assertIn(name, list(parsers.REGISTERED_METHODS))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import pickle
+import unittest
+from tsquare.core import *
+
+SITE_DATA = {'id': 'gtc-cs2110-a', 'title': 'CS-2110-A',
+             'entityURL': 'https://t-square.gatech.edu/direct/site/gtc-cs2110-a',
+             'props': {'term': 'FALL 2013'}, 'newField': 42}
+
+
+class TSquareModelTests(unittest.TestCase):
+
+    def test_known_and_unknown_keys(self):
+        site = TSquareSite.from_dict(SITE_DATA)
+        self.assertEqual(site.id, 'gtc-cs2110-a')
+        self.assertEqual(site.props, {'term': 'FALL 2013'})
+        self.assertEqual(site.newField, 42)
+        self.assertFalse(hasattr(site, '__dict__'))
+
+    def test_missing_keys_are_not_attributes(self):
+        site = TSquareSite(id='x')
+        self.assertFalse(hasattr(site, 'props'))
+        self.assertFalse(hasattr(site, 'nonsense'))
+        with self.assertRaises(AttributeError):
+            site.title
+
+    def test_kwargs_and_from_dict_agree(self):
+        self.assertEqual(TSquareSite(**SITE_DATA).to_dict(),
+                         TSquareSite.from_dict(SITE_DATA).to_dict())
+        self.assertEqual(TSquareSite.from_dict(SITE_DATA).to_dict(), SITE_DATA)
+
+    def test_setattr_and_delattr(self):
+        site = TSquareSite(id='x')
+        site.props = {}
+        site.custom = 'value'
+        self.assertEqual(site.props, {})
+        self.assertEqual(site.custom, 'value')
+        del site.custom
+        self.assertFalse(hasattr(site, 'custom'))
+        self.assertEqual(sorted(site.list_attrs()), ['id', 'props'])
+
+    def test_pickle(self):
+        site = TSquareSite.from_dict(SITE_DATA)
+        for protocol in range(pickle.HIGHEST_PROTOCOL + 1):
+            loaded = pickle.loads(pickle.dumps(site, protocol))
+            self.assertIsInstance(loaded, TSquareSite)
+            self.assertEqual(loaded.to_dict(), SITE_DATA)
+            self.assertFalse(hasattr(loaded, 'description'))
+
+
+if __name__ == "__main__":
+    unittest.main()
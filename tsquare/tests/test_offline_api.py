@@ -0,0 +1,350 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import pickle
+import threading
+import time
+import unittest
+from tsquare.core import *
+from tsquare.httpcache import HTTPCache
+from tsquare.instrumentation import MetricsAggregator, CallbackInstrumentation
+from tsquare.tests.stub_server import StubTSquare, BAD_USERNAME
+
+
+class OfflineAPITests(unittest.TestCase):
+    """
+    Runs TSquareAPI against the stand-in server in stub_server.
+    """
+
+    def setUp(self):
+        self.stub = StubTSquare()
+        self.stub.__enter__()
+
+    def tearDown(self):
+        self.stub.__exit__(None, None, None)
+
+    def _requests_to(self, fragment):
+        return len([x for x in self.stub.requests if fragment in x[1]])
+
+    def test_login(self):
+        api = TSquareAPI('gburdell3', 'password')
+        self.assertIn(api._tg_ticket, self.stub.granting_tickets)
+        self.assertTrue(api._service_ticket.startswith('ST-'))
+
+    def test_bad_login(self):
+        with self.assertRaises(TSquareAuthException):
+            TSquareAPI(BAD_USERNAME, 'password')
+
+    def test_lazy_login(self):
+        api = TSquareAPI('gburdell3', 'password', lazy=True)
+        self.assertEqual(self.stub.requests, [])
+        self.assertEqual(len(api.get_sites()), 2)
+        self.assertEqual(self._requests_to('/cas/rest/tickets'), 2)
+        self.assertIsNone(api._password)
+
+    def test_lazy_login_single_flight(self):
+        api = TSquareAPI('gburdell3', 'password', lazy=True)
+        threads = [threading.Thread(target=api.get_user_info) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.stub.requests.count(('POST', '/cas/rest/tickets')), 1)
+        self.assertEqual(self._requests_to('user/current.json'), 8)
+
+    def test_warm(self):
+        api = TSquareAPI('gburdell3', 'password', lazy=True)
+        self.assertIs(api.warm(), api)
+        self.assertTrue(api._authenticated)
+        api.warm()
+        self.assertEqual(self.stub.requests.count(('POST', '/cas/rest/tickets')), 1)
+
+    def test_lazy_bad_login(self):
+        api = TSquareAPI(BAD_USERNAME, 'password', lazy=True)
+        with self.assertRaises(TSquareAuthException):
+            api.get_sites()
+        with self.assertRaises(NotAuthenticatedException):
+            api.get_sites()
+
+    def test_lazy_logout(self):
+        api = TSquareAPI('gburdell3', 'password', lazy=True)
+        api.logout()
+        self.assertEqual(self.stub.requests, [])
+        self.assertIsNone(api._password)
+        with self.assertRaises(NotAuthenticatedException):
+            api.get_sites()
+
+    def test_lazy_pickle(self):
+        api = TSquareAPI('gburdell3', 'password', lazy=True)
+        api = pickle.loads(pickle.dumps(api))
+        with self.assertRaises(NotAuthenticatedException):
+            api.get_sites()
+
+    def test_user_info(self):
+        user = TSquareAPI('gburdell3', 'password').get_user_info()
+        self.assertEqual(user.displayId, 'gburdell3')
+        self.assertFalse(hasattr(user, 'password'))
+
+    def test_sites(self):
+        sites = TSquareAPI('gburdell3', 'password').get_sites()
+        self.assertEqual([x.id for x in sites], ['gtc-cs2110-a', 'gtc-math2401-b'])
+        self.assertEqual(sites[1].props, {'banner-crn': None, 'term': None,
+                                          'term_eid': None})
+
+    def test_site_by_id(self):
+        site = TSquareAPI('gburdell3', 'password').get_site_by_id('gtc-math2401-b')
+        self.assertEqual(site.title, 'MATH-2401-B')
+
+    def test_expired_session(self):
+        api = TSquareAPI('gburdell3', 'password')
+        self.stub.expire_sessions()
+        with self.assertRaises(SessionExpiredException):
+            api.get_sites()
+        self.assertFalse(api._authenticated)
+
+    def test_iter_sites(self):
+        api = TSquareAPI('gburdell3', 'password')
+        sites = api.iter_sites()
+        self.assertEqual([x.id for x in sites], ['gtc-cs2110-a', 'gtc-math2401-b'])
+        sites = api.iter_sites(raw_filter=lambda x: x['id'].startswith('gtc-math'))
+        self.assertEqual([x.props['term'] for x in sites], [None])
+
+    def test_iter_sites_paged(self):
+        self.stub.scale = 3
+        api = TSquareAPI('gburdell3', 'password')
+        sites = list(api.iter_sites(page_size=4))
+        self.assertEqual([x.id for x in sites], [x.id for x in api.get_sites()])
+        self.assertEqual(self._requests_to('site.json'), 3)
+
+    def test_iter_sites_expired(self):
+        api = TSquareAPI('gburdell3', 'password')
+        self.stub.expire_sessions()
+        with self.assertRaises(SessionExpiredException):
+            api.iter_sites()
+
+    def test_iter_announcements(self):
+        self.stub.scale = 5
+        api = TSquareAPI('gburdell3', 'password')
+        site = api.get_sites()[0]
+        announcements = api.iter_announcements(site, num=7, page_size=3)
+        self.assertEqual([x.id for x in announcements],
+                         [x.id for x in api.get_announcements(site, num=7)])
+        self.assertEqual(self._requests_to('/announcement/'), 4)
+
+    def test_announcements(self):
+        api = TSquareAPI('gburdell3', 'password')
+        announcements = api.get_announcements(api.get_sites()[0])
+        self.assertEqual([x.title for x in announcements],
+                         ['Homework 2 posted', 'Office hours moved'])
+
+    def test_tool_pages(self):
+        for scraper in ('bs4', 'strained'):
+            api = TSquareAPI('gburdell3', 'password', scraper=scraper)
+            site = api.get_sites()[0]
+            self.assertEqual(len(api.get_assignments(site)), 3)
+            grades = api.get_grades(site)
+            self.assertEqual(grades['course_grade']['letter_grade'], 'A')
+            self.assertIn('Lectures meet', api.get_syllabus(site))
+
+    def test_tool_cache(self):
+        api = TSquareAPI('gburdell3', 'password')
+        site = api.get_sites()[0]
+        api.get_assignments(site)
+        api.get_grades(site)
+        api.get_syllabus(site)
+        self.assertEqual(self._requests_to('/portal/site/gtc-cs2110-a'), 4)
+        self.assertEqual(self._requests_to('/portal/site/gtc-cs2110-a/page'), 3)
+        api.invalidate_tools(site)
+        api.get_tools(site)
+        self.assertEqual(self._requests_to('/portal/site/gtc-cs2110-a'), 5)
+
+    def test_grade_records(self):
+        api = TSquareAPI('gburdell3', 'password', scraper='default')
+        site = api.get_sites()[0]
+        gradebook = api.get_grade_records(site)
+        self.assertEqual(gradebook.course_grade.letter, 'A')
+        self.assertEqual([x.score for x in gradebook.records], [95, 88, 41.5])
+        self.assertEqual(api.get_grades(site)['course_grade']['letter_grade'], 'A')
+
+    def test_frame_cache(self):
+        api = TSquareAPI('gburdell3', 'password')
+        site = api.get_sites()[0]
+        api.get_assignments(site)
+        api.get_grades(site)
+        self.assertEqual(len(api.get_assignments(site)), 3)
+        self.assertIn('course_grade', api.get_grades(site))
+        self.assertEqual(self._requests_to('/page/'), 2)
+        self.assertEqual(self._requests_to('/portal/tool/'), 4)
+        api.invalidate_tools(site)
+        api.get_assignments(site)
+        self.assertEqual(self._requests_to('/page/'), 3)
+
+    def test_frame_cache_gone(self):
+        api = TSquareAPI('gburdell3', 'password')
+        site = api.get_sites()[0]
+        api.get_assignments(site)
+        self.stub.gone.add('/portal/tool/asn0')
+        self.stub.set_page('assignments_tool.html', self.stub
+                           .page('assignments_tool.html').replace('asn0', 'asn1'))
+        self.assertEqual(len(api.get_assignments(site)), 3)
+        self.assertEqual(self._requests_to('/portal/tool/asn1'), 1)
+        self.assertEqual(self._requests_to('/page/'), 2)
+
+    def test_frame_cache_moved(self):
+        api = TSquareAPI('gburdell3', 'password')
+        site = api.get_sites()[0]
+        api.get_grades(site)
+        self.stub.moved['/portal/tool/gb0'] = '/portal/tool/gb1'
+        self.assertIn('course_grade', api.get_grades(site))
+        self.assertIn('course_grade', api.get_grades(site))
+        self.assertEqual(self._requests_to('/page/'), 2)
+        self.assertEqual(self._requests_to('/portal/tool/gb1'), 2)
+
+    def test_page_fingerprint(self):
+        api = TSquareAPI('gburdell3', 'password')
+        site = api.get_sites()[0]
+        scraped = []
+        scrape = api._scrape
+        def counting_scrape(method, html, **kwargs):
+            scraped.append(method)
+            return scrape(method, html, **kwargs)
+        api._scrape = counting_scrape
+        start = time.time()
+        first = api.get_grades(site)
+        self.assertTrue(api.changed_since(site, 'grades', start))
+        checked = time.time()
+        first['course_grade']['letter_grade'] = 'F'
+        second = api.get_grades(site)
+        self.assertEqual(second['course_grade']['letter_grade'], 'A')
+        self.assertFalse(api.changed_since(site, 'grades', checked))
+        self.assertEqual(scraped.count('get_grades'), 1)
+        self.stub.set_page('gradebook.html', self.stub.page('gradebook.html')
+                           .replace('>A<', '>B<', 1))
+        self.assertEqual(api.get_grades(site)['course_grade']['letter_grade'], 'B')
+        self.assertTrue(api.changed_since(site, 'grades', checked))
+        self.assertEqual(scraped.count('get_grades'), 2)
+
+    def test_grade_records_share_page_entry(self):
+        api = TSquareAPI('gburdell3', 'password', scraper='default')
+        site = api.get_sites()[0]
+        scraped = []
+        scrape = api._scrape
+        def counting_scrape(method, html, **kwargs):
+            scraped.append(method)
+            return scrape(method, html, **kwargs)
+        api._scrape = counting_scrape
+        api.get_grades(site)
+        checked = time.time()
+        api.get_grade_records(site)
+        api.get_grade_records(site)
+        api.get_grades(site)
+        self.assertEqual(scraped.count('get_grades'), 1)
+        self.assertEqual(scraped.count('get_grade_records'), 1)
+        self.assertFalse(api.changed_since(site, 'grades', checked))
+        self.stub.set_page('gradebook.html', self.stub.page('gradebook.html')
+                           .replace('>A<', '>B<', 1))
+        self.assertEqual(api.get_grade_records(site).course_grade.letter, 'B')
+        self.assertTrue(api.changed_since(site, 'grades', checked))
+
+    def test_parse_pool(self):
+        class _Pool(object):
+            calls = []
+            def apply(self, func, args):
+                self.calls.append(args[:2])
+                return func(*args)
+        pool = _Pool()
+        api = TSquareAPI('gburdell3', 'password', scraper='strained',
+                         parse_pool=pool)
+        site = api.get_sites()[0]
+        self.assertEqual(len(api.get_assignments(site)), 3)
+        self.assertIn('course_grade', api.get_grades(site))
+        self.assertEqual(pool.calls, [('strained', 'get_assignments'),
+                                      ('strained', 'get_grades')])
+        # an unknown scraper falls back to the default one in the pool too
+        api = TSquareAPI('gburdell3', 'password', scraper='no-such-scraper',
+                         parse_pool=pool)
+        self.assertEqual(len(api.get_assignments(site)), 3)
+        self.assertEqual(pool.calls[-1], ('default', 'get_assignments'))
+        api = pickle.loads(pickle.dumps(api))
+        self.assertIsNone(api._parse_pool)
+
+    def test_changed_since_unfetched(self):
+        api = TSquareAPI('gburdell3', 'password', page_cache_size=0)
+        site = api.get_sites()[0]
+        api.get_assignments(site)
+        self.assertTrue(api.changed_since(site, 'assignments', time.time()))
+
+    def test_stream(self):
+        api = TSquareAPI('gburdell3', 'password', scraper='default', stream=True)
+        site = api.get_sites()[0]
+        self.assertEqual([x.name for x in api.get_tools(site)],
+                         ['syllabus', 'resources', 'assignments', 'grades'])
+        self.assertEqual(len(api.get_assignments(site)), 3)
+
+    def test_http_cache(self):
+        cache = HTTPCache()
+        api = TSquareAPI('gburdell3', 'password', http_cache=cache)
+        first = api.get_sites()
+        second = api.get_sites()
+        self.assertEqual([x.id for x in first], [x.id for x in second])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_bulk_fetch(self):
+        api = TSquareAPI('gburdell3', 'password', max_workers=2)
+        results = api.get_all_assignments()
+        self.assertEqual(sorted(results), ['gtc-cs2110-a', 'gtc-math2401-b'])
+        for assignments in results.values():
+            self.assertEqual(len(assignments), 3)
+
+    def test_instrumentation(self):
+        metrics = MetricsAggregator()
+        api = TSquareAPI('gburdell3', 'password', instrumentation=metrics)
+        api.get_assignments(api.get_sites()[0])
+        summary = metrics.summary()
+        self.assertEqual(summary[('login', 'login')]['count'], 2)
+        self.assertEqual(summary[('get_sites', 'build')]['count'], 1)
+        # get_tools runs inside get_assignments; its requests are charged
+        # to get_assignments, but it still gets its own total
+        self.assertEqual(summary[('get_assignments', 'http')]['count'], 3)
+        self.assertGreater(summary[('get_assignments', 'http')]['bytes'], 0)
+        self.assertEqual(summary[('get_assignments', 'parse')]['count'], 3)
+        self.assertEqual(summary[('get_tools', 'total')]['count'], 1)
+        self.assertIsNotNone(metrics.percentile('get_assignments', 'total', 99))
+
+    def test_metrics_summary_while_recording(self):
+        metrics = MetricsAggregator()
+        done = threading.Event()
+        def record():
+            for i in range(20000):
+                metrics.record('m{}'.format(i % 500), 'http', 0.001, bytes=1)
+                if i % 1000 == 0:
+                    metrics.reset()
+            done.set()
+        thread = threading.Thread(target=record)
+        thread.start()
+        try:
+            while not done.is_set():
+                for stats in metrics.summary().values():
+                    self.assertGreater(stats['count'], 0)
+        finally:
+            thread.join()
+
+    def test_instrumentation_callback(self):
+        seen = []
+        def _record(method, phase, duration, **info):
+            seen.append((method, phase, info.get('scraper')))
+        api = TSquareAPI('gburdell3', 'password',
+                         instrumentation=CallbackInstrumentation(_record))
+        api.get_user_info()
+        self.assertIn(('get_user_info', 'parse', 'json'), seen)
+        self.assertIn(('get_user_info', 'total', None), seen)
+
+    def test_pickle(self):
+        api = pickle.loads(pickle.dumps(TSquareAPI('gburdell3', 'password')))
+        self.assertEqual(len(api.get_sites()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
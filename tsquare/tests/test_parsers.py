@@ -0,0 +1,229 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import datetime
+import multiprocessing
+import pickle
+import threading
+import unittest
+from tsquare import parsers
+from tsquare.tests import fixtures
+
+
+class DefaultParserTests(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = parsers.DefaultParser()
+
+    def test_tools(self):
+        tools = self.parser.get_tools(fixtures.load('portal.html'))
+        self.assertEqual([x['name'] for x in tools],
+                         ['syllabus', 'resources', 'assignments', 'grades'])
+
+    def test_iframes(self):
+        iframes = self.parser.get_iframes(fixtures.load('assignments_tool.html'))
+        self.assertEqual(len(iframes), 1)
+        self.assertEqual(iframes[0]['title'], 'Assignments')
+        self.assertTrue(iframes[0]['src'].endswith('/portal/tool/asn0?panel=Main'))
+
+    def test_assignments(self):
+        assignments = self.parser.get_assignments(fixtures.load('assignments.html'))
+        self.assertEqual([x['title'] for x in assignments],
+                         ['Homework 1', 'Homework 2', 'Project 1 - Linked Lists'])
+        self.assertEqual(assignments[1]['dueDate'], 'Sep 20, 2013 5:00 pm')
+
+    def test_repeated_calls_are_stable(self):
+        html = fixtures.load('assignments.html')
+        first = self.parser.get_assignments(html)
+        for i in range(5):
+            self.assertEqual(self.parser.get_assignments(html), first)
+        self.assertEqual(len(first), 3)
+        tools = self.parser.get_tools(fixtures.load('portal.html'))
+        self.assertEqual(self.parser.get_tools(fixtures.load('portal.html')), tools)
+
+    def test_recovers_from_truncated_page(self):
+        html = fixtures.load('assignments.html')
+        self.parser.get_assignments(html[:len(html) // 2])
+        self.assertEqual(len(self.parser.get_assignments(html)), 3)
+
+    def test_threads(self):
+        html = fixtures.load('assignments.html')
+        expected = self.parser.get_assignments(html)
+        results = []
+        def _parse():
+            for i in range(20):
+                results.append(self.parser.get_assignments(html))
+        threads = [threading.Thread(target=_parse) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 80)
+        for result in results:
+            self.assertEqual(result, expected)
+
+    def test_pickle(self):
+        self.parser.get_tools(fixtures.load('portal.html'))
+        parser = pickle.loads(pickle.dumps(self.parser))
+        self.assertEqual(len(parser.get_tools(fixtures.load('portal.html'))), 4)
+
+
+class _Chunks(object):
+    """
+    Splits a page into fixed-size chunks, counting how many were read.
+    """
+    def __init__(self, html, size=256):
+        self.chunks = [html[i:i + size] for i in range(0, len(html), size)]
+        self.read = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.read += 1
+            yield chunk
+
+
+class StreamingParserTests(unittest.TestCase):
+
+    def test_default_iframes_stop_early(self):
+        parser = parsers.DefaultParser()
+        html = fixtures.load('assignments_tool.html') + ' ' * 4096
+        chunks = _Chunks(html)
+        iframes = parser.stream_iframes(chunks, 'Assignments ')
+        self.assertEqual(iframes, parser.get_iframes(html))
+        self.assertLess(chunks.read, len(chunks.chunks))
+
+    def test_default_iframes_missing_title_reads_everything(self):
+        parser = parsers.DefaultParser()
+        chunks = _Chunks(fixtures.load('assignments_tool.html'))
+        iframes = parser.stream_iframes(chunks, 'Gradebook')
+        self.assertEqual(len(iframes), 1)
+        self.assertEqual(chunks.read, len(chunks.chunks))
+
+    def test_default_tools_stop_at_content(self):
+        parser = parsers.DefaultParser()
+        html = fixtures.load('portal.html')
+        chunks = _Chunks(html)
+        self.assertEqual(parser.stream_tools(chunks), parser.get_tools(html))
+        self.assertLess(chunks.read, len(chunks.chunks))
+
+    def test_fallback_reads_whole_page(self):
+        if not parsers.BS_AVAILABLE:
+            self.skipTest('BeautifulSoup not available.')
+        parser = parsers.LXMLParser()
+        html = fixtures.load('portal.html').decode('utf-8')
+        chunks = _Chunks(html)
+        self.assertEqual(parser.stream_tools(chunks), parser.get_tools(html))
+        self.assertEqual(chunks.read, len(chunks.chunks))
+
+
+class StrainedParserTests(unittest.TestCase):
+
+    def setUp(self):
+        if not parsers.BS_AVAILABLE:
+            self.skipTest('BeautifulSoup not available.')
+        self.full = parsers.LXMLParser()
+        self.strained = parsers.StrainedParser()
+
+    def _check(self, method, fixture):
+        html = fixtures.load(fixture)
+        self.assertEqual(getattr(self.strained, method)(html),
+                         getattr(self.full, method)(html))
+
+    def test_iframes(self):
+        self._check('get_iframes', 'assignments_tool.html')
+
+    def test_tools(self):
+        self._check('get_tools', 'portal.html')
+
+    def test_assignments(self):
+        self._check('get_assignments', 'assignments.html')
+
+    def test_grades(self):
+        self._check('get_grades', 'gradebook.html')
+
+    def test_syllabus(self):
+        self._check('get_syllabus', 'syllabus.html')
+
+    def test_registered(self):
+        self.assertIs(parsers.REGISTERED_METHODS['strained'],
+                      parsers.StrainedParser)
+
+
+
+class GradebookParserTests(unittest.TestCase):
+
+    def setUp(self):
+        self.parser = parsers.DefaultParser()
+
+    def test_same_as_soup(self):
+        if not parsers.BS_AVAILABLE:
+            self.skipTest('BeautifulSoup not available.')
+        for name, scale in [('gradebook.html', 1), ('gradebook.html', 5),
+                            ('gradebook_messy.html', 1)]:
+            html = fixtures.load(name, scale=scale).decode('utf-8')
+            self.assertEqual(self.parser.get_grades(html),
+                             parsers.LXMLParser().get_grades(html))
+
+    def test_records(self):
+        gradebook = self.parser.get_grade_records(fixtures.load('gradebook.html'))
+        self.assertEqual(gradebook.course_grade, parsers.CourseGrade('A', 93.5))
+        self.assertEqual(len(gradebook.records), 3)
+        midterm = gradebook.records[2]
+        self.assertEqual((midterm.category, midterm.name), ('Exams', 'Midterm'))
+        self.assertEqual((midterm.score, midterm.possible), (41.5, 50.0))
+        self.assertEqual(midterm.date, datetime.date(2013, 10, 10))
+        self.assertEqual(midterm.comments, 'Curved +3')
+
+    def test_records_from_messy_page(self):
+        gradebook = self.parser.get_grade_records(
+            fixtures.load('gradebook_messy.html').decode('utf-8'))
+        self.assertEqual(gradebook.course_grade, parsers.CourseGrade(u'B+', 88.25))
+        participation, lab = gradebook.records
+        self.assertEqual((participation.category, participation.name),
+                         (None, 'Participation'))
+        self.assertEqual((lab.category, lab.name),
+                         (u'Labs &Quizzes', u'Lab1\u2014 setup'))
+        self.assertEqual((lab.score, lab.possible), (9.0, 10.0))
+        self.assertEqual(lab.comments, u'Good\xa0startgraded lateseenotes')
+
+    def test_records_on_every_backend(self):
+        html = fixtures.load('gradebook.html')
+        self.assertEqual(parsers.LXMLParser().get_grade_records(html),
+                         self.parser.get_grade_records(html))
+
+    def test_unavailable_and_uncategorized(self):
+        html = ('<table></table><table><tr><td>-</td></tr></table>'
+                '<table><tr><td class="left">Quiz &amp; lab</td><td>soon</td>'
+                '<td>A-</td><td></td><td></td></tr></table>')
+        self.assertEqual(self.parser.get_grades(html),
+                         {'course_grade': {'error': 'Not yet available'},
+                          'grades': {'unnamed': [{'name': 'Quiz &amp; lab',
+                                                  'date': 'soon', 'grade': 'A-',
+                                                  'comments': ''}]}})
+        gradebook = self.parser.get_grade_records(html)
+        self.assertIsNone(gradebook.course_grade)
+        self.assertEqual(gradebook.records,
+                         (parsers.GradeRecord(None, 'Quiz & lab', None, None,
+                                              'A-', None, ''),))
+
+
+class ProcessPoolTests(unittest.TestCase):
+
+    def test_scrape_in_pool(self):
+        pool = multiprocessing.Pool(2)
+        try:
+            for scraper in ['default', 'strained']:
+                if scraper == 'strained' and not parsers.BS_AVAILABLE:
+                    continue
+                html = fixtures.load('assignments.html').decode('utf-8')
+                self.assertEqual(pool.apply(parsers.scrape,
+                                            (scraper, 'get_assignments', html)),
+                                 parsers.scrape(scraper, 'get_assignments', html))
+        finally:
+            pool.terminate()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import threading
+import time
+import unittest
+from tsquare.core import *
+from tsquare.pool import TSquareClientPool
+from tsquare.tests.stub_server import StubTSquare
+
+
+class TSquareClientPoolTests(unittest.TestCase):
+    """
+    Tests TSquareClientPool against the stand-in server.
+    """
+
+    def setUp(self):
+        self.stub = StubTSquare()
+        self.stub.__enter__()
+
+    def tearDown(self):
+        self.stub.__exit__(None, None, None)
+
+    def test_calls_by_username(self):
+        pool = TSquareClientPool()
+        pool.login('gburdell3', 'password')
+        pool.login('gburdell4', 'password')
+        self.assertEqual(len(pool.get_sites('gburdell3')), 2)
+        site = pool.get_site_by_id('gburdell4', 'gtc-math2401-b')
+        self.assertEqual(site.title, 'MATH-2401-B')
+        self.assertEqual(len(pool), 2)
+
+    def test_shared_transport(self):
+        pool = TSquareClientPool()
+        first = pool.login('gburdell3', 'password')
+        second = pool.login('gburdell4', 'password')
+        self.assertIs(first._session.get_adapter('http://x'),
+                      second._session.get_adapter('http://x'))
+        # but each user keeps their own cookies
+        self.assertNotEqual(first._session.cookies['JSESSIONID'],
+                            second._session.cookies['JSESSIONID'])
+
+    def test_unknown_user(self):
+        pool = TSquareClientPool()
+        with self.assertRaises(NotAuthenticatedException):
+            pool.get_sites('gburdell3')
+
+    def test_lru_eviction(self):
+        pool = TSquareClientPool(max_clients=2)
+        pool.login('a', 'password')
+        pool.login('b', 'password')
+        pool.get_user_info('a')
+        pool.login('c', 'password')
+        self.assertIn('a', pool)
+        self.assertNotIn('b', pool)
+        self.assertIn('c', pool)
+
+    def test_idle_timeout(self):
+        pool = TSquareClientPool(idle_timeout=0.05)
+        pool.login('a', 'password')
+        time.sleep(0.1)
+        with self.assertRaises(NotAuthenticatedException):
+            pool.get_user_info('a')
+
+    def test_relogin_with_credential_provider(self):
+        pool = TSquareClientPool(max_clients=1,
+                                 credential_provider=lambda user: 'password')
+        pool.login('a', 'password')
+        pool.login('b', 'password')
+        self.assertNotIn('a', pool)
+        self.assertEqual(len(pool.get_sites('a')), 2)
+        self.assertNotIn('b', pool)
+
+    def test_relogin_single_flight(self):
+        asked = []
+        def provider(username):
+            asked.append(username)
+            time.sleep(0.05)
+            return 'password'
+        pool = TSquareClientPool(credential_provider=provider)
+        threads = [threading.Thread(target=pool.get_user_info, args=('a',))
+                   for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(asked, ['a'])
+        self.assertEqual(self.stub.requests.count(('POST', '/cas/rest/tickets')), 1)
+
+    def test_logout(self):
+        pool = TSquareClientPool()
+        api = pool.login('a', 'password')
+        pool.logout('a')
+        self.assertNotIn('a', pool)
+        self.assertNotIn(api._tg_ticket, self.stub.granting_tickets)
+
+    def test_logout_missing_user(self):
+        pool = TSquareClientPool(credential_provider=lambda user: 'password')
+        pool.logout('a')
+        self.assertEqual(self.stub.requests, [])
+        self.assertNotIn('a', pool)
+
+    def test_per_user_concurrency(self):
+        pool = TSquareClientPool(per_user_concurrency=1)
+        api = pool.login('a', 'password')
+        lock = threading.Lock()
+        running = [0, 0]
+        def get_user_info():
+            with lock:
+                running[0] += 1
+                running[1] = max(running)
+            time.sleep(0.02)
+            with lock:
+                running[0] -= 1
+        api.get_user_info = get_user_info
+        threads = [threading.Thread(target=pool.get_user_info, args=('a',))
+                   for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(running[1], 1)
+
+    def test_queued_calls_leave_global_slots(self):
+        pool = TSquareClientPool(max_concurrency=2, per_user_concurrency=1)
+        busy = pool.login('a', 'password')
+        pool.login('b', 'password')
+        release = threading.Event()
+        busy.get_user_info = release.wait
+        threads = [threading.Thread(target=pool.get_user_info, args=('a',))
+                   for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.05)
+        # one of a's calls runs and two wait for a's slot, leaving a global
+        # slot free for b
+        done = threading.Event()
+        other = threading.Thread(target=lambda: (pool.get_user_info('b'),
+                                                 done.set()))
+        other.start()
+        try:
+            self.assertTrue(done.wait(5))
+        finally:
+            release.set()
+            for thread in threads + [other]:
+                thread.join()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import threading
+import unittest
+import requests
+from tsquare.core import *
+from tsquare.httpcache import HTTPCache
+from tsquare.tests.stub_server import StubTSquare
+
+
+class RacingAPI(TSquareAPI):
+    """
+    Calls race, once, the first time _authenticated is read as False, to
+    stand in for another thread finishing a login at that moment.
+    """
+    race = None
+
+    @property
+    def _authenticated(self):
+        value = self.__dict__.get('_authenticated_value', False)
+        race, self.race = self.race, None
+        if not value and race is not None:
+            race()
+        return value
+
+    @_authenticated.setter
+    def _authenticated(self, value):
+        self.__dict__['_authenticated_value'] = value
+
+
+class ReauthTests(unittest.TestCase):
+    """
+    Tests renewing expired sessions against the stand-in server.
+    """
+
+    def setUp(self):
+        self.stub = StubTSquare()
+        self.stub.__enter__()
+
+    def tearDown(self):
+        self.stub.__exit__(None, None, None)
+
+    def _requests_to(self, method, path):
+        return self.stub.requests.count((method, path))
+
+    def test_expired_without_reauth(self):
+        api = TSquareAPI('gburdell3', 'password')
+        self.stub.expire_sessions()
+        with self.assertRaises(SessionExpiredException):
+            api.get_user_info()
+        with self.assertRaises(NotAuthenticatedException):
+            api.get_user_info()
+
+    def test_forbidden_keeps_session(self):
+        for http_cache in (None, HTTPCache()):
+            api = TSquareAPI('gburdell3', 'password', http_cache=http_cache)
+            self.stub.forbidden.add('/direct/site/gtc-other.json')
+            with self.assertRaises(requests.HTTPError):
+                api.get_site_by_id('gtc-other')
+            self.assertTrue(api._authenticated)
+            self.assertEqual(len(api.get_sites()), 2)
+
+    def test_expired_json_with_http_cache(self):
+        api = TSquareAPI('gburdell3', 'password', http_cache=HTTPCache())
+        api.get_user_info()
+        self.stub.expire_sessions()
+        with self.assertRaises(SessionExpiredException):
+            api.get_user_info()
+
+    def test_reauth_with_granting_ticket(self):
+        api = TSquareAPI('gburdell3', 'password', auto_reauth=True)
+        self.stub.expire_sessions()
+        self.assertEqual(len(api.get_sites()), 2)
+        self.assertEqual(api.get_user_info().displayId, 'gburdell3')
+        # the password was only posted for the first login
+        self.assertEqual(self._requests_to('POST', '/cas/rest/tickets'), 1)
+        self.assertEqual(self._requests_to('GET', '/sakai-login-tool/container'), 2)
+
+    def test_reauth_portal_redirect(self):
+        api = TSquareAPI('gburdell3', 'password', auto_reauth=True)
+        site = api.get_sites()[0]
+        self.stub.expire_sessions()
+        api.invalidate_tools()
+        self.assertEqual(len(api.get_assignments(site)), 3)
+
+    def test_reauth_single_flight(self):
+        api = TSquareAPI('gburdell3', 'password', auto_reauth=True)
+        self.stub.expire_sessions()
+        results = []
+        def fetch():
+            results.append(api.get_user_info().displayId)
+        threads = [threading.Thread(target=fetch) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['gburdell3'] * 8)
+        self.assertEqual(self._requests_to('GET', '/sakai-login-tool/container'), 2)
+
+    def test_reauth_credential_provider(self):
+        asked = []
+        def provider(username):
+            asked.append(username)
+            return 'password'
+        api = TSquareAPI('gburdell3', 'password', auto_reauth=True,
+                         credential_provider=provider)
+        self.stub.expire_sessions()
+        self.stub.revoke_tickets()
+        self.assertEqual(api.get_user_info().displayId, 'gburdell3')
+        self.assertEqual(asked, ['gburdell3'])
+        self.assertEqual(self._requests_to('POST', '/cas/rest/tickets'), 2)
+
+    def test_reauth_no_credential_provider(self):
+        api = TSquareAPI('gburdell3', 'password', auto_reauth=True)
+        self.stub.expire_sessions()
+        self.stub.revoke_tickets()
+        with self.assertRaises(SessionExpiredException):
+            api.get_user_info()
+
+    def test_reauth_race(self):
+        api = RacingAPI('gburdell3', 'password', auto_reauth=True)
+        self.stub.expire_sessions()
+        with self.assertRaises(SessionExpiredException):
+            api._session_expired()
+        # another thread renews the session between this call's check of
+        # _authenticated and its decision to renew
+        api.race = lambda: api._reauthenticate(api._login_generation)
+        self.assertEqual(api.get_user_info().displayId, 'gburdell3')
+        self.assertEqual(self._requests_to('GET', '/sakai-login-tool/container'), 2)
+
+    def test_lazy_login_race(self):
+        api = RacingAPI('gburdell3', 'password', lazy=True)
+        api.race = api.warm
+        self.assertEqual(api.get_user_info().displayId, 'gburdell3')
+        self.assertEqual(self._requests_to('POST', '/cas/rest/tickets'), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,155 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import pickle
+import threading
+import time
+import unittest
+import requests
+from tsquare.core import *
+from tsquare.scheduler import RequestScheduler
+from tsquare.tests.stub_server import StubTSquare
+
+
+class _FakeResponse(object):
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.headers = {}
+        self.content = ''
+
+    def close(self):
+        pass
+
+
+class _FakeSession(object):
+    """
+    Answers with the given statuses in turn; an exception class in the
+    list is raised instead.
+    """
+    def __init__(self, statuses, delay=0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.calls = 0
+        self.running = 0
+        self.most_running = 0
+        self._lock = threading.Lock()
+
+    def request(self, method, url, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+            status = self.statuses.pop(0) if len(self.statuses) > 1 else self.statuses[0]
+        time.sleep(self.delay)
+        with self._lock:
+            self.running -= 1
+        if isinstance(status, type):
+            raise status()
+        return _FakeResponse(status)
+
+
+class RequestSchedulerTests(unittest.TestCase):
+    def test_retries_server_errors(self):
+        scheduler = RequestScheduler(backoff=0.001)
+        session = _FakeSession([503, 502, 200])
+        response = scheduler.request(session, 'GET', 'http://x/a')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(session.calls, 3)
+        self.assertEqual(scheduler.stats()['x']['retries'], 2)
+
+    def test_gives_up(self):
+        scheduler = RequestScheduler(retries=2, backoff=0.001)
+        session = _FakeSession([503])
+        self.assertEqual(scheduler.request(session, 'GET', 'http://x/a')
+                         .status_code, 503)
+        self.assertEqual(session.calls, 3)
+
+    def test_client_errors_not_retried(self):
+        scheduler = RequestScheduler(backoff=0.001)
+        session = _FakeSession([404])
+        scheduler.request(session, 'GET', 'http://x/a')
+        self.assertEqual(session.calls, 1)
+
+    def test_connection_errors(self):
+        scheduler = RequestScheduler(retries=2, backoff=0.001)
+        session = _FakeSession([requests.ConnectionError, 200])
+        self.assertEqual(scheduler.request(session, 'GET', 'http://x/a')
+                         .status_code, 200)
+        session = _FakeSession([requests.ConnectionError])
+        with self.assertRaises(requests.ConnectionError):
+            scheduler.request(session, 'GET', 'http://x/a')
+        self.assertEqual(scheduler.stats()['x']['failures'], 1)
+
+    def test_rate_limit(self):
+        scheduler = RequestScheduler(rate=50, burst=1)
+        session = _FakeSession([200])
+        start = time.time()
+        for i in range(6):
+            scheduler.request(session, 'GET', 'http://x/a')
+        self.assertGreaterEqual(time.time() - start, 0.09)
+        # hosts are limited separately
+        start = time.time()
+        scheduler.request(session, 'GET', 'http://y/a')
+        self.assertLess(time.time() - start, 0.02)
+
+    def test_concurrency(self):
+        scheduler = RequestScheduler(max_concurrency=2)
+        session = _FakeSession([200], delay=0.01)
+        threads = [threading.Thread(target=scheduler.request,
+                                    args=(session, 'GET', 'http://x/a'))
+                   for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(session.most_running, 2)
+        stats = scheduler.stats()['x']
+        self.assertEqual((stats['requests'], stats['queued'], stats['active']),
+                         (6, 0, 0))
+        self.assertGreater(stats['wait_max'], 0)
+
+    def test_pickle(self):
+        scheduler = RequestScheduler(rate=5, max_concurrency=3)
+        scheduler.request(_FakeSession([200]), 'GET', 'http://x/a')
+        copy = pickle.loads(pickle.dumps(scheduler))
+        self.assertEqual((copy.rate, copy.max_concurrency), (5, 3))
+        self.assertEqual(copy.stats(), {})
+
+
+class ScheduledAPITests(unittest.TestCase):
+    """
+    Runs TSquareAPI through a RequestScheduler against the stand-in server.
+    """
+
+    def setUp(self):
+        self.stub = StubTSquare()
+        self.stub.__enter__()
+
+    def tearDown(self):
+        self.stub.__exit__(None, None, None)
+
+    def test_retries(self):
+        scheduler = RequestScheduler(backoff=0.001)
+        self.stub.fail('/cas/rest/tickets', 1)
+        api = TSquareAPI('gburdell3', 'password', scheduler=scheduler)
+        self.stub.fail('/direct/site.json', 2)
+        self.assertEqual(len(api.get_sites()), 2)
+        self.assertEqual(sum(x['retries'] for x in scheduler.stats().values()), 3)
+
+    def test_without_scheduler(self):
+        api = TSquareAPI('gburdell3', 'password')
+        self.stub.fail('/direct/site.json', 1)
+        with self.assertRaises(requests.HTTPError):
+            api.get_sites()
+
+    def test_pickle(self):
+        api = TSquareAPI('gburdell3', 'password', scheduler=RequestScheduler())
+        api = pickle.loads(pickle.dumps(api))
+        self.assertEqual(len(api.get_sites()), 2)
+        self.assertEqual(len(api._session.cookies), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import base64
+import json
+import shutil
+import tempfile
+import unittest
+import zlib
+from tsquare.core import *
+from tsquare.sessions import *
+from tsquare.tests.stub_server import StubTSquare
+
+
+class SessionTests(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = StubTSquare()
+        self.stub.__enter__()
+        self.directory = tempfile.mkdtemp()
+        self.passwords = []
+
+    def tearDown(self):
+        self.stub.__exit__(None, None, None)
+        shutil.rmtree(self.directory)
+
+    def _password(self, username):
+        self.passwords.append(username)
+        return 'password'
+
+    def _cas_requests(self):
+        return len([x for x in self.stub.requests if x[1].startswith('/cas/')])
+
+    def test_round_trip_skips_cas(self):
+        api = TSquareAPI('gburdell3', 'password')
+        data = dump_session(api)
+        self.assertTrue(data.startswith('tsq1:'))
+        before = self._cas_requests()
+        restored = load_session(data)
+        self.assertEqual(restored.username, 'gburdell3')
+        self.assertEqual(restored._tg_ticket, api._tg_ticket)
+        self.assertEqual(len(restored.get_sites()), 2)
+        self.assertEqual(self._cas_requests(), before)
+
+    def test_bad_data(self):
+        with self.assertRaises(ValueError):
+            load_session('tsq0:abc')
+        with self.assertRaises(ValueError):
+            load_session('tsq1:not-base64!')
+
+    def test_incomplete_data(self):
+        api = TSquareAPI('gburdell3', 'password')
+        state = decode_session(dump_session(api))
+        del state['tgt']
+        data = 'tsq1:' + base64.urlsafe_b64encode(zlib.compress(json.dumps(state)))
+        with self.assertRaises(ValueError):
+            load_session(data)
+        store = MemorySessionStore()
+        store.save('gburdell3', data)
+        resume(store, 'gburdell3', self._password)
+        self.assertEqual(self.passwords, ['gburdell3'])
+
+    def test_resume(self):
+        store = FileSessionStore(self.directory)
+        first = resume(store, 'gburdell3', self._password)
+        self.assertEqual(self.passwords, ['gburdell3'])
+        second = resume(store, 'gburdell3', self._password)
+        self.assertEqual(self.passwords, ['gburdell3'])
+        self.assertEqual(second._tg_ticket, first._tg_ticket)
+        self.assertEqual(len(second.get_sites()), 2)
+
+    def test_resume_replaces_damaged_session(self):
+        store = MemorySessionStore()
+        store.save('gburdell3', 'garbage')
+        api = resume(store, 'gburdell3', self._password)
+        self.assertEqual(self.passwords, ['gburdell3'])
+        self.assertEqual(decode_session(store.load('gburdell3'))['tgt'],
+                         api._tg_ticket)
+
+    def test_relogin_after_expiry(self):
+        store = MemorySessionStore()
+        resume(store, 'gburdell3', self._password)
+        self.stub.expire_sessions()
+        api = resume(store, 'gburdell3', self._password)
+        with self.assertRaises(SessionExpiredException):
+            api.get_sites()
+        relogin(store, api, self._password)
+        self.assertEqual(len(api.get_sites()), 2)
+        self.assertEqual(len(load_session(store.load('gburdell3')).get_sites()), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,228 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+from datetime import datetime
+import logging
+import pickle
+import shutil
+import tempfile
+import time
+import unittest
+from tsquare.core import *
+from tsquare.instrumentation import CallbackInstrumentation
+from tsquare.store import SQLiteStore, StoreReader, due_time
+from tsquare.tests.stub_server import StubTSquare
+
+# old enough to include the announcements in the recorded fixture
+AGE = 100000
+
+# the due dates of the assignments in the recorded fixture
+FIRST_DUE = time.mktime(datetime(2013, 9, 6, 17, 0).timetuple())
+SECOND_DUE = time.mktime(datetime(2013, 9, 20, 17, 0).timetuple())
+
+
+class SQLiteStoreTests(unittest.TestCase):
+    """
+    Tests SQLiteStore on its own.
+    """
+
+    def setUp(self):
+        self.store = SQLiteStore()
+
+    def test_due_time(self):
+        self.assertEqual(due_time({'dueDate': 'Sep 6, 2013 5:00 pm'}), FIRST_DUE)
+        self.assertEqual(due_time({'dueDate': ''}), None)
+        self.assertEqual(due_time({}), None)
+
+    def test_put_replaces_snapshot(self):
+        self.store.put('user', 'site', '', [('a', {'id': 'a'}), ('b', {'id': 'b'})])
+        self.store.put('user', 'site', '', [('b', {'id': 'b', 'title': 'B'})])
+        self.assertEqual(self.store.get('user', 'site'), [{'id': 'b', 'title': 'B'}])
+
+    def test_put_without_replace_keeps_items(self):
+        self.store.put('user', 'announcement', 's1', [('a', {'id': 'a'})], False)
+        self.store.put('user', 'announcement', 's1', [('b', {'id': 'b'})], False)
+        self.assertEqual(len(self.store.get('user', 'announcement', 's1')), 2)
+
+    def test_put_without_fetched_keeps_age(self):
+        self.store.put('user', 'site', '', [('a', {'id': 'a'})], False, False)
+        self.assertEqual(self.store.get('user', 'site'), [{'id': 'a'}])
+        self.assertEqual(self.store.fetched_at('user', 'site'), None)
+
+    def test_users_are_separate(self):
+        self.store.put('one', 'site', '', [('a', {'id': 'a'})])
+        self.assertEqual(self.store.get('two', 'site'), [])
+        self.assertEqual(self.store.fetched_at('two', 'site'), None)
+        self.store.delete('one')
+        self.assertEqual(self.store.get('one', 'site'), [])
+
+    def test_fetched_at(self):
+        before = time.time()
+        self.store.put('user', 'assignment', 's1', [])
+        self.assertTrue(before <= self.store.fetched_at('user', 'assignment', 's1')
+                        <= time.time())
+        self.assertEqual(self.store.fetched_at('user', 'assignment', 's2'), None)
+
+    def test_assignments_due_across_sites(self):
+        self.store.put('user', 'assignment', 's1',
+                       [('1', {'title': '1', 'dueDate': 'Sep 20, 2013 5:00 pm'})])
+        self.store.put('user', 'assignment', 's2',
+                       [('2', {'title': '2', 'dueDate': 'Sep 6, 2013 5:00 pm'}),
+                        ('3', {'title': '3', 'dueDate': ''})])
+        due = self.store.assignments_due('user', FIRST_DUE - 60, SECOND_DUE + 60)
+        self.assertEqual([x['title'] for x in due], ['2', '1'])
+        due = self.store.assignments_due('user', FIRST_DUE - 60, FIRST_DUE + 60)
+        self.assertEqual([x['title'] for x in due], ['2'])
+
+    def test_file_survives_reopening(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = join(directory, 'tsquare.db')
+            store = SQLiteStore(path)
+            store.put('user', 'site', '', [('a', {'id': 'a'})])
+            store.close()
+            self.assertEqual(SQLiteStore(path).get('user', 'site'), [{'id': 'a'}])
+            copy = pickle.loads(pickle.dumps(SQLiteStore(path)))
+            self.assertEqual(copy.get('user', 'site'), [{'id': 'a'}])
+        finally:
+            shutil.rmtree(directory)
+
+
+class WriteThroughTests(unittest.TestCase):
+    """
+    Tests that TSquareAPI writes what it fetches to its store, and that
+    StoreReader reads it back without TSquare.
+    """
+
+    def setUp(self):
+        self.stub = StubTSquare()
+        self.stub.__enter__()
+        self.store = SQLiteStore()
+        self.api = TSquareAPI('gburdell3', 'password', store=self.store)
+        self.sites = self.api.get_sites()
+        self.site = self.sites[0]
+        self.reader = StoreReader(self.store, 'gburdell3', self.api)
+
+    def tearDown(self):
+        self.stub.__exit__(None, None, None)
+
+    def test_fetches_are_stored(self):
+        assignments = self.api.get_assignments(self.site)
+        grades = self.api.get_grades(self.site)
+        announcements = self.api.get_announcements(self.site)
+        user = self.api.get_user_info()
+        del self.stub.requests[:]
+        self.assertEqual([x.id for x in self.reader.get_sites(fresh=False)],
+                         [x.id for x in self.sites])
+        self.assertEqual([x.to_dict() for x in
+                          self.reader.get_assignments(self.site, fresh=False)],
+                         [x.to_dict() for x in assignments])
+        self.assertEqual(self.reader.get_grades(self.site, fresh=False), grades)
+        self.assertEqual(sorted(x.id for x in
+                                self.reader.get_announcements(self.site, age=AGE,
+                                                              fresh=False)),
+                         sorted(x.id for x in announcements))
+        self.assertEqual(self.reader.get_user_info(fresh=False).id, user.id)
+        self.assertEqual(self.stub.requests, [])
+
+    def test_assignments_due_without_network(self):
+        self.api.get_assignments(self.site)
+        del self.stub.requests[:]
+        due = self.reader.assignments_due(days=7, start=FIRST_DUE - 60)
+        self.assertEqual([x.dueDate for x in due], ['Sep 6, 2013 5:00 pm'])
+        due = self.reader.assignments_due(days=20, start=FIRST_DUE - 60)
+        self.assertEqual(len(due), 2)
+        self.assertEqual(self.stub.requests, [])
+
+    def test_staleness_decides_source(self):
+        self.api.get_assignments(self.site)
+        del self.stub.requests[:]
+        self.reader.get_assignments(self.site)
+        self.assertEqual(self.stub.requests, [])
+        self.assertTrue(self.reader.age('assignment', self.site.id) < 300)
+        self.reader.get_assignments(self.site, fresh=True)
+        self.assertNotEqual(self.stub.requests, [])
+        del self.stub.requests[:]
+        self.reader.max_age = 0
+        self.reader.get_assignments(self.site)
+        self.assertNotEqual(self.stub.requests, [])
+
+    def test_missing_data_is_fetched(self):
+        self.assertEqual(self.reader.age('grades', self.site.id), None)
+        grades = self.reader.get_grades(self.site)
+        self.assertEqual(self.reader.get_grades(self.site, fresh=False), grades)
+        self.assertEqual(StoreReader(self.store, 'someone').get_sites(), [])
+
+    def test_announcements_accumulate(self):
+        self.api.get_announcements(self.site, num=1)
+        self.api.get_announcements(self.site, num=10)
+        stored = self.reader.get_announcements(self.site, age=AGE, fresh=False)
+        self.assertEqual(len(stored), len(self.api.get_announcements(self.site)))
+        self.assertEqual(len(self.reader.get_announcements(age=AGE, fresh=False)),
+                         len(stored))
+
+    def test_announcements_of_every_site_dont_freshen_one(self):
+        self.api.get_announcements()
+        self.assertTrue(self.reader.age('announcement') < 300)
+        self.assertEqual(self.reader.age('announcement', self.site.id), None)
+        self.assertNotEqual(self.reader.get_announcements(age=AGE, fresh=False), [])
+        del self.stub.requests[:]
+        self.reader.get_announcements(self.site, age=AGE)
+        self.assertNotEqual(self.stub.requests, [])
+
+    def test_site_by_id_is_stored(self):
+        store = SQLiteStore()
+        api = TSquareAPI('gburdell3', 'password', store=store)
+        site = api.get_site_by_id(self.site.id)
+        reader = StoreReader(store, 'gburdell3', api)
+        self.assertEqual([x.id for x in reader.get_sites(fresh=False)], [site.id])
+        self.assertEqual(reader.age('site'), None)
+
+    def test_announcements_limited_like_fetch(self):
+        self.api.get_announcements(self.site)
+        stored = self.reader.get_announcements(self.site, num=1, age=AGE,
+                                               fresh=False)
+        self.assertEqual([x.id for x in stored],
+                         [self.api.get_announcements(self.site, num=1)[0].id])
+        # the recorded announcements are from 2013
+        self.assertEqual(self.reader.get_announcements(self.site, fresh=False), [])
+
+    def test_items_without_id_skipped(self):
+        self.api._write_through('assignment', self.site.id,
+                                [(None, {'status': 'Not Started'}),
+                                 ('a', {'title': 'a'})])
+        self.assertEqual(self.store.get('gburdell3', 'assignment', self.site.id),
+                         [{'title': 'a'}])
+
+    def test_store_failure_doesnt_fail_fetch(self):
+        errors = []
+        def record(method, phase, duration, **info):
+            if phase == 'store':
+                errors.append(info.get('error'))
+        self.store.close()
+        api = TSquareAPI('gburdell3', 'password', store=self.store,
+                         instrumentation=CallbackInstrumentation(record))
+        self.assertEqual(len(api.get_sites()), 2)
+        self.assertEqual(len(errors), 1)
+        self.assertIn('ProgrammingError', errors[0])
+
+    def test_store_failure_is_logged(self):
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logger = logging.getLogger('tsquare.core')
+        logger.addHandler(handler)
+        try:
+            self.store.close()
+            self.api.get_sites()
+        finally:
+            logger.removeHandler(handler)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0].levelno, logging.WARNING)
+        self.assertIsNotNone(records[0].exc_info)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from tsquare.core import *
+from tsquare.sync import (AnnouncementSync, FileCursorStore, SyncCursor,
+                          DAY_MS)
+from tsquare.tests.stub_server import StubTSquare
+
+
+class AnnouncementSyncTests(unittest.TestCase):
+    """
+    Tests AnnouncementSync against the stand-in server.
+    """
+
+    def setUp(self):
+        self.stub = StubTSquare()
+        self.stub.__enter__()
+        self.api = TSquareAPI('gburdell3', 'password')
+        self.site = self.api.get_sites()[0]
+        self.data = json.loads(self.stub.page('announcements.json'))
+        self.now = int(time.time() * 1000)
+        for i, item in enumerate(self.data['announcement_collection']):
+            item['createdOn'] = self.now - (i + 1) * 3600000
+        self._publish()
+
+    def tearDown(self):
+        self.stub.__exit__(None, None, None)
+
+    def _publish(self):
+        self.stub.set_page('announcements.json', json.dumps(self.data))
+
+    def _post(self, count):
+        items = self.data['announcement_collection']
+        for i in range(count):
+            items.insert(0, dict(items[-1], id='new-{}'.format(i),
+                                 title='New {}'.format(i),
+                                 createdOn=self.now + i))
+        items.sort(key=lambda x: -x['createdOn'])
+        self._publish()
+
+    def test_first_sync(self):
+        sync = AnnouncementSync(self.api)
+        self.assertEqual(len(sync.sync(self.site)), 2)
+        self.assertEqual(sync.sync(self.site), [])
+
+    def test_new_announcements(self):
+        sync = AnnouncementSync(self.api)
+        sync.sync(self.site)
+        self._post(1)
+        self.assertEqual([x.id for x in sync.sync(self.site)], ['new-0'])
+        self.assertEqual(sync.sync(self.site), [])
+
+    def test_edited_announcement(self):
+        sync = AnnouncementSync(self.api)
+        sync.sync(self.site)
+        self.data['announcement_collection'][1]['body'] = '<p>Cancelled.</p>'
+        self._publish()
+        changed = sync.sync(self.site)
+        self.assertEqual(len(changed), 1)
+        self.assertEqual(changed[0].body, '<p>Cancelled.</p>')
+
+    def _record_ages(self):
+        ages = []
+        get_announcements = self.api.get_announcements
+        def record(site, num, age):
+            ages.append(age)
+            # the stand-in server ignores d, so drop what TSquare would
+            cutoff = time.time() * 1000 - age * DAY_MS
+            return [x for x in get_announcements(site, num, age)
+                    if x.createdOn >= cutoff]
+        self.api.get_announcements = record
+        return ages
+
+    def test_asks_only_for_days_since_latest(self):
+        ages = self._record_ages()
+        sync = AnnouncementSync(self.api)
+        sync.sync(self.site)
+        sync.sync(self.site)
+        sync.sync(self.site)
+        # the newest announcement is an hour old: one day, plus the slack
+        self.assertEqual(ages, [20, 2, 2])
+
+    def test_quiet_site_window(self):
+        for item in self.data['announcement_collection']:
+            item['createdOn'] -= 100 * DAY_MS
+        self._publish()
+        ages = self._record_ages()
+        sync = AnnouncementSync(self.api, age=200)
+        sync.sync(self.site)
+        sync.sync(self.site)
+        self.assertEqual(ages, [200, 102])
+
+    def _edit_old_announcement(self, sync):
+        self.data['announcement_collection'][1]['createdOn'] -= 3 * DAY_MS
+        self._publish()
+        sync.sync(self.site)
+        self.data['announcement_collection'][1]['body'] = '<p>Cancelled.</p>'
+        self._publish()
+        return sync.sync(self.site)
+
+    def test_old_edits_missed_without_scan(self):
+        self._record_ages()
+        self.assertEqual(self._edit_old_announcement(AnnouncementSync(self.api)), [])
+
+    def test_edit_scan(self):
+        self._record_ages()
+        sync = AnnouncementSync(self.api, edit_scan_interval=0)
+        changed = self._edit_old_announcement(sync)
+        self.assertEqual([x.body for x in changed], ['<p>Cancelled.</p>'])
+
+    def test_grows_window(self):
+        sync = AnnouncementSync(self.api, num=2)
+        sync.sync(self.site)
+        self._post(5)
+        changed = sync.sync(self.site)
+        self.assertEqual(sorted(x.id for x in changed),
+                         ['new-{}'.format(i) for i in range(5)])
+
+    def test_file_store(self):
+        directory = tempfile.mkdtemp()
+        try:
+            AnnouncementSync(self.api, FileCursorStore(directory)).sync(self.site)
+            sync = AnnouncementSync(self.api, FileCursorStore(directory))
+            self.assertEqual(sync.sync(self.site), [])
+            cursor = sync.cursor(self.site)
+            self.assertIsInstance(cursor, SyncCursor)
+            self.assertEqual(len(cursor.seen), 2)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_reset(self):
+        sync = AnnouncementSync(self.api)
+        sync.sync(self.site)
+        sync.reset(self.site)
+        self.assertIsNone(sync.cursor(self.site))
+        self.assertEqual(len(sync.sync(self.site)), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,30 @@
+from os.path import abspath, join, dirname
+import sys
+# ensure that tsquare is in the syspath for testing purposes
+sys.path.append(abspath(join(abspath(dirname(__file__)), "..", "..")))
+
+import unittest
+from tsquare.transport import HTTPTransport
+
+
+class HTTPTransportTests(unittest.TestCase):
+
+    def test_sessions_share_pools(self):
+        transport = HTTPTransport(pool_connections=2, pool_maxsize=32)
+        first = transport.session()
+        second = transport.session()
+        self.assertIs(first.get_adapter('https://t-square.gatech.edu/'),
+                      second.get_adapter('https://login.gatech.edu/'))
+        self.assertIs(first.get_adapter('https://t-square.gatech.edu/'),
+                      transport._adapter)
+
+    def test_sessions_have_separate_cookies(self):
+        transport = HTTPTransport()
+        first = transport.session()
+        second = transport.session()
+        first.cookies.set('JSESSIONID', 'abc')
+        self.assertNotIn('JSESSIONID', second.cookies)
+
+
+if __name__ == "__main__":
+    unittest.main()
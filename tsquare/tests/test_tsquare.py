@@ -143,6 +143,33 @@ class TSquareAPITests(unittest.TestCase):
             self.assertTrue(hasattr(assignment, 'dueDate'))
 
 
+class TSquareBulkFetchTests(unittest.TestCase):
+
+    def setUp(self):
+        # build an api object without logging in; _fetch_all only needs
+        # the worker count
+        self.api = TSquareAPI.__new__(TSquareAPI)
+        self.api._authenticated = True
+        self.api.max_workers = 4
+        self.sites = [TSquareSite(id='site{}'.format(i)) for i in range(6)]
+
+    def test_results_keyed_by_site(self):
+        results = self.api._fetch_all(lambda site: site.id.upper(),
+                                      self.sites, None)
+        self.assertEqual(sorted(results.keys()),
+                         sorted(site.id for site in self.sites))
+        self.assertEqual(results['site3'], 'SITE3')
+
+    def test_errors_captured_per_site(self):
+        def _fetch(site):
+            if site.id == 'site2':
+                raise TSquareException('boom')
+            return []
+        results = self.api._fetch_all(_fetch, self.sites, 2)
+        self.assertIsInstance(results['site2'], TSquareException)
+        self.assertEqual(results['site0'], [])
+
+
 class TSquarePickleAPITests(unittest.TestCase):
 
     def setUp(self):
@@ -0,0 +1,46 @@
+from requests.adapters import HTTPAdapter
+import requests
+
+
+class HTTPTransport(object):
+    """
+    Owns the connection pools used to talk to CAS and TSquare. Sessions
+    created by the same transport share its pools, so a TLS handshake with
+    a host happens once and the connection is then kept alive for every
+    later request, across logins and across users.
+    """
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False):
+        """
+        Initialize an HTTPTransport.
+        @param pool_connections - The number of hosts to keep connection
+                                  pools for.
+        @param pool_maxsize - The maximum number of connections kept alive
+                              per host. Should be at least the number of
+                              threads that use the transport at once.
+        @param pool_block - If True, a request waits for a free connection
+                            when the pool of its host is exhausted instead of
+                            opening a connection that is thrown away after.
+        """
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self._adapter = HTTPAdapter(pool_connections=pool_connections,
+                                    pool_maxsize=pool_maxsize,
+                                    pool_block=pool_block)
+
+    def session(self):
+        """
+        Returns a new requests.Session with its own cookie jar that sends
+        its requests through this transport's connection pools.
+        """
+        session = requests.Session()
+        session.mount('https://', self._adapter)
+        session.mount('http://', self._adapter)
+        return session
+
+    def close(self):
+        """
+        Closes every pooled connection.
+        """
+        self._adapter.close()